@@ -0,0 +1,157 @@
+"""Fingerprinted, precompressed static assets.
+
+build() (the `flask build-assets` command, run at deploy) copies every file
+under static/ into static/dist/ with a hash of its content in the name,
+e.g. script.js -> script.1f3a9c02b7d4.js. JavaScript and CSS are minified
+first, and text files get .gz and .br siblings compressed at the highest
+levels, so no request pays for compression. dist/assets.json maps each
+source name to its hashed name.
+
+At runtime AssetManifest rewrites url_for('static', filename='script.js')
+to the hashed file, which the app serves with a one year immutable
+Cache-Control, picking the sibling the client's Accept-Encoding allows. A
+changed file gets a new name, so browsers never have to revalidate. Without
+a build (local development) url_for keeps returning the plain files, and a
+source edited after the last build is served plain until the next one.
+
+The minifiers (rjsmin, rcssmin) and brotli are optional: without them files
+are copied as they are and only .gz siblings are written.
+"""
+import gzip
+import hashlib
+import json
+import logging
+import os
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli is optional
+    brotli = None
+try:
+    import rcssmin
+    import rjsmin
+except ImportError:  # pragma: no cover - the minifiers are optional
+    rcssmin = rjsmin = None
+
+BUILD_DIR = 'dist'
+MANIFEST = 'assets.json'
+UNHASHED = {'sw.js', 'manifest.json'}  # the service worker and web app manifest must keep their URLs
+COMPRESSIBLE = ('.js', '.css', '.json', '.svg', '.html', '.txt', '.xml', '.ico')
+MIN_SAVING = 0.1  # only keep a compressed sibling that is at least this much smaller
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))  # in order of preference
+
+log = logging.getLogger(__name__)
+
+
+def hashed_name(name, content):
+    """script.js -> script.<12 hex digits of sha256>.js"""
+    stem, ext = os.path.splitext(name)
+    return f'{stem}.{hashlib.sha256(content).hexdigest()[:12]}{ext}'
+
+
+def minify(name, content):
+    if rjsmin is None:
+        return content
+    if name.endswith('.js'):
+        return rjsmin.jsmin(content)
+    if name.endswith('.css'):
+        return rcssmin.cssmin(content)
+    return content
+
+
+def compressed_variants(content):
+    """(suffix, bytes) of the compressed siblings worth keeping"""
+    variants = [('.gz', gzip.compress(content, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variants.append(('.br', brotli.compress(content, quality=11)))
+    return [(suffix, data) for suffix, data in variants if len(data) <= len(content) * (1 - MIN_SAVING)]
+
+
+def source_files(static_dir):
+    """Names (relative, with /) of the files under static_dir that get built"""
+    names = []
+    for root, dirs, files in os.walk(static_dir):
+        if root == static_dir and BUILD_DIR in dirs:
+            dirs.remove(BUILD_DIR)
+        for file in files:
+            name = os.path.relpath(os.path.join(root, file), static_dir).replace(os.sep, '/')
+            if name not in UNHASHED and not file.startswith('.'):
+                names.append(name)
+    return sorted(names)
+
+
+def _write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(f'{path}.tmp', 'wb') as f:
+        f.write(content)
+    os.replace(f'{path}.tmp', path)
+
+
+def build(static_dir):
+    """Write static_dir/dist and its manifest; returns [(name, hashed name, bytes, {suffix: bytes})]"""
+    build_dir = os.path.join(static_dir, BUILD_DIR)
+    manifest = {}
+    built = []
+    for name in source_files(static_dir):
+        with open(os.path.join(static_dir, name), 'rb') as f:
+            content = minify(name, f.read())
+        target = hashed_name(name, content)
+        _write(os.path.join(build_dir, target), content)
+        variants = compressed_variants(content) if name.endswith(COMPRESSIBLE) else []
+        for suffix, data in variants:
+            _write(os.path.join(build_dir, target + suffix), data)
+        manifest[name] = target
+        built.append((name, target, len(content), {suffix: len(data) for suffix, data in variants}))
+    _write(os.path.join(build_dir, MANIFEST), json.dumps(manifest, indent=2, sort_keys=True).encode())
+
+    # Drop the files of earlier builds
+    keep = {MANIFEST} | {target + suffix for target in manifest.values() for suffix in ('', '.gz', '.br')}
+    for root, _, files in os.walk(build_dir):
+        for file in files:
+            path = os.path.join(root, file)
+            if os.path.relpath(path, build_dir).replace(os.sep, '/') not in keep:
+                os.remove(path)
+    return built
+
+
+class AssetManifest:
+    """The hashed names of the last build, for url_for('static', ...)"""
+
+    def __init__(self, static_dir):
+        self.static_dir = static_dir
+        self.directory = os.path.join(static_dir, BUILD_DIR)
+        self.files = {}
+        self.load()
+
+    def load(self):
+        path = os.path.join(self.directory, MANIFEST)
+        try:
+            with open(path) as f:
+                files = json.load(f)
+            built_at = os.path.getmtime(path)
+        except (OSError, ValueError):
+            self.files = {}
+            return
+        for name in list(files):
+            try:
+                stale = os.path.getmtime(os.path.join(self.static_dir, name)) > built_at
+            except OSError:
+                stale = True
+            if stale:
+                log.warning('asset changed since the last build, serving it unhashed', extra={'asset': name})
+                del files[name]
+        self.files = files
+
+    def rewrite(self, values):
+        """url_defaults hook: point values['filename'] at the built file"""
+        target = self.files.get(values.get('filename'))
+        if target is not None:
+            values['filename'] = f'{BUILD_DIR}/{target}'
+
+
+def precompressed(path, accept_encodings):
+    """(path, Content-Encoding) of the best sibling of path the client accepts, or (path, None)"""
+    for encoding, suffix in ENCODINGS:
+        if accept_encodings[encoding] and os.path.isfile(path + suffix):
+            return path + suffix, encoding
+    return path, None
@@ -0,0 +1,453 @@
+"""Load simulator for the dashboards in static/script.js.
+
+Seeds a throwaway database, logs in N users and M admins, then replays what
+their open dashboards do while the event stream is down: every poll interval
+(30 s in script.js) each user fetches /api/notifications_count and
+/api/user_reports?since=, and each admin fetches /api/new_reports_count
+twice (checkAdminUpdates and setupPeriodicReportCheck), plus the badge
+refresh when there are new reports. Users now and then submit a report and
+open their notifications; admins now and then change a report's status.
+
+Time can be compressed with --speedup, so a minute of wall time covers
+several poll rounds. Requests go through Flask's test client in this
+process by default, which also counts the SQL queries each request runs;
+--url sends them to a running server instead (seed the database that server
+uses with --database-url; query counts are then unavailable).
+
+Reported per route: p50/p95/p99 latency, request count, errors and queries
+per request, plus overall throughput and how far requests fell behind their
+schedule (a growing lag means the app is saturated). The poll cost per
+dashboard turns into an estimate of how many open dashboards one busy
+worker thread can keep up with.
+
+    python bench/loadsim.py --users 200 --admins 5 --duration 60
+    python bench/loadsim.py --save sqlite-200u      # bench/baselines/sqlite-200u.json
+    python bench/loadsim.py --compare sqlite-200u   # diff this run against it
+"""
+import argparse
+import heapq
+import http.cookiejar
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_DIR = os.path.join(ROOT, 'bench', 'baselines')
+POLL_INTERVAL = 30.0  # seconds, as in setupPeriodicUpdateCheck() and setupPeriodicReportCheck()
+BENCH_PASSWORD = 'bench-password'
+PROBLEM_TYPES = ['Pothole', 'Streetlight', 'Garbage', 'Water Leak', 'Graffiti']
+STATUSES = ['Pending', 'In Progress', 'Resolved']
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(1, int(round(pct / 100 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class Recorder:
+    """Latencies, errors and query counts per route label, and requests per poll by role"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.routes = {}
+        self.lags = []
+        self.polls = {'user': 0, 'admin': 0}
+        self.role_requests = {'user': {}, 'admin': {}}
+
+    def record(self, label, seconds, ok, queries, role):
+        with self._lock:
+            self.role_requests[role][label] = self.role_requests[role].get(label, 0) + 1
+            route = self.routes.setdefault(label, {'latencies': [], 'errors': 0, 'queries': []})
+            route['latencies'].append(seconds)
+            if not ok:
+                route['errors'] += 1
+            if queries is not None:
+                route['queries'].append(queries)
+
+    def record_lag(self, seconds):
+        with self._lock:
+            self.lags.append(seconds)
+
+    def record_poll(self, role):
+        with self._lock:
+            self.polls[role] += 1
+
+    def summary(self, wall_seconds):
+        routes = {}
+        total = 0
+        for label, route in sorted(self.routes.items()):
+            latencies = sorted(route['latencies'])
+            total += len(latencies)
+            routes[label] = {
+                'count': len(latencies),
+                'errors': route['errors'],
+                'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+                'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+                'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+                'mean_ms': round(sum(latencies) / len(latencies) * 1000, 2),
+                'queries_per_request': (round(sum(route['queries']) / len(route['queries']), 2)
+                                        if route['queries'] else None),
+            }
+        lags = sorted(self.lags)
+        return {
+            'requests': total,
+            'throughput_rps': round(total / wall_seconds, 1) if wall_seconds else None,
+            'schedule_lag_p95_ms': round(percentile(lags, 95) * 1000, 1) if lags else None,
+            'routes': routes,
+            'capacity': self.capacity(routes),
+        }
+
+    def capacity(self, routes):
+        """Dashboards one fully busy worker thread can keep up with, from the measured poll costs"""
+        estimate = {}
+        for role, polls in self.polls.items():
+            if not polls:
+                continue
+            # Mean request time one dashboard costs per poll interval
+            cost = sum(routes[label]['mean_ms'] * count / polls
+                       for label, count in self.role_requests[role].items())
+            estimate[role] = {'poll_cost_ms': round(cost, 2),
+                              'dashboards_per_thread': int(POLL_INTERVAL * 1000 / cost) if cost else None}
+        return estimate
+
+
+class TestClientTransport:
+    """Requests through Flask's test client, counting the SQL statements each one runs"""
+
+    def __init__(self, app_module):
+        from sqlalchemy import event
+        self.app = app_module.app
+        self._local = threading.local()
+        with self.app.app_context():
+            event.listen(app_module.db.engine, 'before_cursor_execute', self._count_query)
+
+    def _count_query(self, *args):
+        if getattr(self._local, 'queries', None) is not None:
+            self._local.queries += 1
+
+    def session(self):
+        return self.app.test_client()
+
+    def request(self, client, method, path, json_body=None, form=None):
+        self._local.queries = 0
+        try:
+            if form is not None:
+                response = client.open(path, method=method, data=form, content_type='multipart/form-data')
+            else:
+                response = client.open(path, method=method, json=json_body)
+            body = response.get_json(silent=True)
+            response.close()  # runs the streamed body's cleanup, like a real server would
+            return response.status_code, body, self._local.queries
+        finally:
+            self._local.queries = None
+
+
+class HTTPTransport:
+    """Requests to a running server over HTTP; form posts are sent as JSON"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+
+    def session(self):
+        return urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+
+    def request(self, opener, method, path, json_body=None, form=None):
+        payload = json_body if form is None else form
+        data = json.dumps(payload).encode() if payload is not None else None
+        req = urllib.request.Request(self.base_url + path, data=data, method=method,
+                                     headers={'Content-Type': 'application/json'} if data else {})
+        try:
+            with opener.open(req, timeout=30) as response:
+                status, raw = response.status, response.read()
+        except urllib.error.HTTPError as e:
+            status, raw = e.code, e.read()
+        try:
+            body = json.loads(raw) if raw else None
+        except ValueError:
+            body = None
+        return status, body, None
+
+
+class Dashboard:
+    """One open browser tab, following the request pattern of script.js"""
+
+    def __init__(self, transport, recorder, email, admin, options, rng):
+        self.transport = transport
+        self.recorder = recorder
+        self.email = email
+        self.admin = admin
+        self.role = 'admin' if admin else 'user'
+        self.options = options
+        self.rng = rng
+        self.client = transport.session()
+        self.sync_token = None
+        self.report_ids = []
+
+    def call(self, label, method, path, json_body=None, form=None):
+        started = time.perf_counter()
+        try:
+            status, body, queries = self.transport.request(self.client, method, path, json_body, form)
+            ok = status < 400 and not (isinstance(body, dict) and body.get('success') is False)
+        except Exception:
+            status, body, queries, ok = None, None, None, False
+        self.recorder.record(label, time.perf_counter() - started, ok, queries, self.role)
+        return body if isinstance(body, dict) else {}
+
+    def open(self):
+        """Login and the first dashboard load; not part of the measured window"""
+        body = self.call('POST /api/login', 'POST', '/api/login', {'email': self.email, 'password': BENCH_PASSWORD})
+        if not body.get('success'):
+            raise RuntimeError(f'Login failed for {self.email}: {body}')
+        self.call('GET /api/user_info', 'GET', '/api/user_info')
+        self.call('GET /api/stats', 'GET', '/api/stats')
+        if self.admin:
+            reports = self.call('GET /api/all_reports', 'GET', '/api/all_reports')
+            self.report_ids = [report['id'] for report in reports.get('reports', [])][:200]
+            self.call('GET /api/new_reports_count', 'GET', '/api/new_reports_count')
+        else:
+            self.call('GET /api/notifications_count', 'GET', '/api/notifications_count')
+            reports = self.call('GET /api/user_reports', 'GET', '/api/user_reports')
+            self.sync_token = reports.get('sync_token')
+
+    def poll(self):
+        """One poll interval's worth of requests"""
+        self.recorder.record_poll(self.role)
+        if self.admin:
+            self.call('GET /api/new_reports_count', 'GET', '/api/new_reports_count')
+            data = self.call('GET /api/new_reports_count', 'GET', '/api/new_reports_count')
+            if data.get('count'):
+                self.call('GET /api/new_reports_count', 'GET', '/api/new_reports_count')
+            if self.report_ids and self.rng.random() < self.options.admin_update_rate:
+                self.call('POST /api/update_report_status', 'POST', '/api/update_report_status',
+                          {'report_id': self.rng.choice(self.report_ids), 'status': self.rng.choice(STATUSES[:2])})
+            return
+
+        self.call('GET /api/notifications_count', 'GET', '/api/notifications_count')
+        path = '/api/user_reports'
+        if self.sync_token:
+            path += '?since=' + urllib.parse.quote(self.sync_token)
+        reports = self.call('GET /api/user_reports?since', 'GET', path)
+        self.sync_token = reports.get('sync_token', self.sync_token)
+        if self.rng.random() < self.options.submit_rate:
+            self.call('POST /api/submit_report', 'POST', '/api/submit_report', form={
+                'problem_type': self.rng.choice(PROBLEM_TYPES),
+                'location': f'{self.rng.randint(1, 999)} Bench Street',
+                'issue': f'Simulated issue {self.rng.random():.6f}',
+                'priority': 'Medium',
+                'latitude': f'{self.rng.uniform(14.5, 14.7):.5f}',
+                'longitude': f'{self.rng.uniform(120.9, 121.1):.5f}',
+            })
+            self.call('GET /api/stats', 'GET', '/api/stats')
+        if self.rng.random() < self.options.open_notifications_rate:
+            notifications = self.call('GET /api/notifications', 'GET', '/api/notifications').get('notifications', [])
+            if notifications:
+                self.call('POST /api/notifications/mark_read', 'POST', '/api/notifications/mark_read',
+                          {'up_to_id': max(n['id'] for n in notifications)})
+
+
+def seed(app_module, users, admins, reports_per_user, rng):
+    """Bulk-insert bench users, admins and their reports; returns (user emails, admin emails)"""
+    from sqlalchemy import insert
+    import geo
+    A = app_module
+    with A.app.app_context():
+        A.migrate_database()
+        password = A.hash_password(BENCH_PASSWORD)
+        run = f'{int(time.time())}{rng.randint(0, 999)}'
+        accounts = ([dict(username=f'bench-user-{run}-{i}', email=f'bench-user-{run}-{i}@bench.local',
+                          password=password, role='user') for i in range(users)]
+                    + [dict(username=f'bench-admin-{run}-{i}', email=f'bench-admin-{run}-{i}@bench.local',
+                            password=password, role='admin') for i in range(admins)])
+        A.db.session.execute(insert(A.User), accounts)
+        A.db.session.commit()
+        user_ids = [user_id for user_id, in A.db.session.query(A.User.id).filter(
+            A.User.email.like(f'bench-user-{run}-%'))]
+
+        now = datetime.utcnow()
+        reports = []
+        for user_id in user_ids:
+            for _ in range(reports_per_user):
+                created = now - timedelta(minutes=rng.randint(0, 60 * 24 * 60))
+                latitude, longitude = rng.uniform(14.5, 14.7), rng.uniform(120.9, 121.1)
+                reports.append(dict(
+                    user_id=user_id, name='bench', problem_type=rng.choice(PROBLEM_TYPES),
+                    location=f'{rng.randint(1, 999)} Seed Avenue', issue=f'Seeded issue {rng.random():.6f}',
+                    date=created.strftime('%Y-%m-%d %H:%M:%S'), status=rng.choice(STATUSES), priority='Medium',
+                    latitude=latitude, longitude=longitude, geohash=geo.encode(latitude, longitude),
+                    created_at=created, updated_at=created,
+                ))
+        for start in range(0, len(reports), 5000):
+            A.db.session.execute(insert(A.Report), reports[start:start + 5000])
+        A.db.session.commit()
+        A.reconcile_report_counters()
+        A.reconcile_unread_counts()
+        A.db.session.commit()
+    return ([account['email'] for account in accounts if account['role'] == 'user'],
+            [account['email'] for account in accounts if account['role'] == 'admin'])
+
+
+def simulate(dashboards, duration, speedup, concurrency, recorder):
+    """Run every dashboard's poll() once per (compressed) interval for duration seconds"""
+    interval = POLL_INTERVAL / speedup
+    started = time.perf_counter()
+    deadline = started + duration
+    # Tabs were opened at random moments, so their polls are spread over the interval
+    schedule = [(started + random.uniform(0, interval), i) for i in range(len(dashboards))]
+    heapq.heapify(schedule)
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            with lock:
+                if not schedule or schedule[0][0] >= deadline:
+                    return
+                due, index = heapq.heappop(schedule)
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            recorder.record_lag(max(0.0, -delay))
+            dashboards[index].poll()
+            with lock:
+                heapq.heappush(schedule, (due + interval, index))
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for future in [pool.submit(worker) for _ in range(concurrency)]:
+            future.result()
+    return time.perf_counter() - started
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_summary(result):
+    print(f"\n{result['requests']} requests in {result['wall_seconds']:.1f} s "
+          f"({result['throughput_rps']} req/s), schedule lag p95 {result['schedule_lag_p95_ms']} ms")
+    print(f"{'route':<36} {'count':>7} {'err':>5} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'q/req':>6}")
+    for label, route in result['routes'].items():
+        qpr = '-' if route['queries_per_request'] is None else route['queries_per_request']
+        print(f"{label:<36} {route['count']:>7} {route['errors']:>5} {route['p50_ms']:>8} "
+              f"{route['p95_ms']:>8} {route['p99_ms']:>8} {qpr:>6}")
+    for role, estimate in result['capacity'].items():
+        print(f"{role} dashboard: {estimate['poll_cost_ms']} ms per poll -> "
+              f"~{estimate['dashboards_per_thread']} dashboards per busy worker thread")
+
+
+def baseline_path(name):
+    return name if name.endswith('.json') else os.path.join(BASELINE_DIR, f'{name}.json')
+
+
+def compare(result, baseline):
+    """Print p95 latency and queries per request next to a saved baseline"""
+    print(f"\nCompared with {baseline.get('commit')} ({baseline.get('recorded_at')}):")
+    print(f"{'route':<36} {'p95 ms':>17} {'change':>8} {'q/req':>13}")
+    for label, route in result['routes'].items():
+        old = baseline['routes'].get(label)
+        if not old:
+            print(f"{label:<36} {'new':>17}")
+            continue
+        change = (route['p95_ms'] - old['p95_ms']) / old['p95_ms'] * 100 if old['p95_ms'] else 0.0
+        queries = f"{old['queries_per_request']} -> {route['queries_per_request']}"
+        print(f"{label:<36} {old['p95_ms']:>7} -> {route['p95_ms']:<7} {change:>+7.0f}% {queries:>13}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--admins', type=int, default=5)
+    parser.add_argument('--reports-per-user', type=int, default=5)
+    parser.add_argument('--duration', type=float, default=30.0, help='measured wall-clock seconds')
+    parser.add_argument('--speedup', type=float, default=10.0, help='poll this many times faster than script.js')
+    parser.add_argument('--concurrency', type=int, default=8, help='simultaneous requests (gunicorn threads)')
+    parser.add_argument('--submit-rate', type=float, default=0.01, help='chance a user submits a report per poll')
+    parser.add_argument('--open-notifications-rate', type=float, default=0.05)
+    parser.add_argument('--admin-update-rate', type=float, default=0.1)
+    parser.add_argument('--database-url', help='database to seed (default: a new SQLite file)')
+    parser.add_argument('--url', help='send requests to this running server instead of the test client')
+    parser.add_argument('--real-password-hashing', action='store_true',
+                        help='seed with the production hash cost (slow logins during setup)')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--save', metavar='NAME', help='save the result as bench/baselines/NAME.json')
+    parser.add_argument('--compare', metavar='NAME', help='compare with a saved baseline (name or path)')
+    options = parser.parse_args(argv)
+
+    if options.url and not options.database_url:
+        parser.error('--url needs --database-url for the database that server uses')
+    workdir = tempfile.mkdtemp(prefix='loadsim-')
+    os.environ['DATABASE_URL'] = options.database_url or 'sqlite:///' + os.path.join(workdir, 'bench.sqlite')
+    os.environ.setdefault('PHOTO_STORE_PATH', os.path.join(workdir, 'photos'))
+    os.environ.setdefault('EVENT_BACKEND', 'memory')
+    # Every simulated client logs in from the same address
+    os.environ.setdefault('RATE_LIMIT_BACKEND', 'memory')
+    os.environ.setdefault('LOGIN_IP_BURST', '1000000')
+    if not options.real_password_hashing:
+        os.environ.setdefault('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:1000')
+    sys.path.insert(0, ROOT)
+    import app as app_module
+
+    rng = random.Random(options.seed)
+    random.seed(options.seed)
+    print(f"🔄 Seeding {options.users} users, {options.admins} admins, "
+          f"{options.users * options.reports_per_user} reports into {os.environ['DATABASE_URL'].split('@')[-1]}")
+    user_emails, admin_emails = seed(app_module, options.users, options.admins, options.reports_per_user, rng)
+
+    transport = HTTPTransport(options.url) if options.url else TestClientTransport(app_module)
+    setup = Recorder()
+    dashboards = ([Dashboard(transport, setup, email, False, options, random.Random(rng.random())) for email in user_emails]
+                  + [Dashboard(transport, setup, email, True, options, random.Random(rng.random())) for email in admin_emails])
+    print(f"🔄 Opening {len(dashboards)} dashboards")
+    with ThreadPoolExecutor(max_workers=options.concurrency) as pool:
+        list(pool.map(lambda dashboard: dashboard.open(), dashboards))
+
+    recorder = Recorder()
+    for dashboard in dashboards:
+        dashboard.recorder = recorder
+
+    print(f"🔄 Polling for {options.duration:.0f} s at {options.speedup:g}x speed, concurrency {options.concurrency}")
+    wall = simulate(dashboards, options.duration, options.speedup, options.concurrency, recorder)
+
+    result = recorder.summary(wall)
+    result['wall_seconds'] = round(wall, 2)
+    result['polls'] = recorder.polls
+    result['commit'] = git_commit()
+    result['recorded_at'] = datetime.utcnow().isoformat(timespec='seconds')
+    result['environment'] = {'python': platform.python_version(), 'machine': platform.machine(),
+                             'cpus': os.cpu_count(), 'transport': 'http' if options.url else 'test_client',
+                             'database': os.environ['DATABASE_URL'].split(':', 1)[0]}
+    result['options'] = {key: value for key, value in vars(options).items()
+                         if key not in ('save', 'compare', 'database_url', 'url')}
+    print_summary(result)
+
+    if options.compare:
+        with open(baseline_path(options.compare)) as f:
+            compare(result, json.load(f))
+    if options.save:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        path = baseline_path(options.save)
+        with open(path, 'w') as f:
+            json.dump(result, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"✅ Baseline saved to {os.path.relpath(path, ROOT)}")
+    return result
+
+
+if __name__ == '__main__':
+    main()
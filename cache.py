@@ -0,0 +1,53 @@
+"""A small in-process TTL cache.
+
+Entries expire after `ttl` seconds and can be invalidated early. Each
+process has its own copy, so a write made in another worker is only seen
+after that worker's invalidation reaches this one (e.g. through the event
+broker) or the entry expires; keep the TTL short.
+"""
+import threading
+import time
+
+
+class TTLCache:
+    def __init__(self, ttl, maxsize=10000):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._generation = 0
+
+    def get_or_load(self, key, load):
+        """Cached value for key, or load() stored until it expires.
+
+        A value loaded while the key was being invalidated is returned but not
+        cached, so an invalidation is never undone by a slow load.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[1] > now:
+                return entry[0]
+            generation = self._generation
+        value = load()
+        with self._lock:
+            if self._generation == generation:
+                if len(self._entries) >= self.maxsize:
+                    self._evict(now)
+                self._entries[key] = (value, now + self.ttl)
+        return value
+
+    def _evict(self, now):
+        expired = [key for key, (_, expires) in self._entries.items() if expires <= now]
+        for key in expired or list(self._entries)[:max(1, self.maxsize // 10)]:
+            del self._entries[key]
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._generation += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
@@ -0,0 +1,123 @@
+"""Near-duplicate detection for newly submitted reports.
+
+Two signals are indexed per report as (band, bucket) keys in one table:
+
+- text: a MinHash signature over character shingles of issue + location,
+  split into LSH bands. Reports whose texts are similar share a band with
+  high probability, so candidates come from an index lookup rather than a
+  comparison against every open report.
+- photo: a 64-bit difference hash (dHash) of the photo, split into four
+  16-bit chunks. Two hashes within PHOTO_MAX_DISTANCE bits of each other
+  must agree on at least one chunk (pigeonhole), so the chunks are exact
+  lookup keys for near-identical photos.
+
+Candidates are then scored in Python with the exact Jaccard similarity of
+their shingles; see score().
+"""
+import hashlib
+import io
+import re
+
+from PIL import Image
+
+SHINGLE_SIZE = 4
+LSH_BANDS = 16
+LSH_ROWS = 2  # s=0.3 similar texts share a band ~78% of the time, s=0.1 ones ~15%
+NUM_PERMUTATIONS = LSH_BANDS * LSH_ROWS
+PHOTO_BAND_OFFSET = 100  # photo chunks use bands 100-103, text bands 0-15
+PHOTO_CHUNKS = 4
+PHOTO_MAX_DISTANCE = PHOTO_CHUNKS - 1
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+
+def _hash64(value):
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), 'big')
+
+
+# Fixed (a, b) pairs so signatures stay comparable across processes and deploys
+_PERMUTATIONS = [(_hash64(f'a{i}') % (_MERSENNE_PRIME - 1) + 1, _hash64(f'b{i}') % _MERSENNE_PRIME)
+                 for i in range(NUM_PERMUTATIONS)]
+
+
+def to_signed64(value):
+    """Fit an unsigned 64-bit value into a signed BIGINT column"""
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def shingles(text):
+    """Character shingles of lowercased, punctuation-free text"""
+    normalized = ' '.join(re.findall(r'\w+', (text or '').lower()))
+    if len(normalized) <= SHINGLE_SIZE:
+        return {normalized} if normalized else set()
+    return {normalized[i:i + SHINGLE_SIZE] for i in range(len(normalized) - SHINGLE_SIZE + 1)}
+
+
+def minhash(text):
+    """MinHash signature of text, or None if there is nothing to hash"""
+    hashes = [_hash64(shingle) & _MAX_HASH for shingle in shingles(text)]
+    if not hashes:
+        return None
+    return [min((a * h + b) % _MERSENNE_PRIME for h in hashes) for a, b in _PERMUTATIONS]
+
+
+def jaccard(text_a, text_b):
+    """Jaccard similarity of the shingles of two texts"""
+    a, b = shingles(text_a), shingles(text_b)
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def text_buckets(signature):
+    """(band, bucket) index keys for a MinHash signature"""
+    if not signature:
+        return []
+    buckets = []
+    for band in range(LSH_BANDS):
+        rows = signature[band * LSH_ROWS:(band + 1) * LSH_ROWS]
+        buckets.append((band, to_signed64(_hash64(','.join(map(str, rows))))))
+    return buckets
+
+
+def photo_dhash(source):
+    """64-bit difference hash of an image (bytes or file path), or None if it can't be read"""
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    try:
+        with Image.open(source) as image:
+            image.draft('L', (64, 64))  # JPEGs decode at a fraction of full size
+            pixels = list(image.convert('L').resize((9, 8), Image.Resampling.BILINEAR).getdata())
+    except Exception:
+        return None
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            bits = (bits << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    if bits == 0:
+        return None  # a flat image would match every other flat image
+    return to_signed64(bits)
+
+
+def photo_buckets(dhash):
+    """(band, bucket) index keys for a photo dHash"""
+    if dhash is None:
+        return []
+    unsigned = dhash & ((1 << 64) - 1)
+    return [(PHOTO_BAND_OFFSET + i, (unsigned >> (16 * i)) & 0xFFFF) for i in range(PHOTO_CHUNKS)]
+
+
+def photo_distance(dhash_a, dhash_b):
+    """Differing bits between two dHashes, or None if either is missing"""
+    if dhash_a is None or dhash_b is None:
+        return None
+    return bin((dhash_a ^ dhash_b) & ((1 << 64) - 1)).count('1')
+
+
+def score(text, dhash, candidate_text, candidate_dhash):
+    """How likely two reports of the same type describe the same problem, 0-1"""
+    text_score = jaccard(text, candidate_text)
+    distance = photo_distance(dhash, candidate_dhash)
+    photo_score = 1.0 - distance / 64 if distance is not None and distance <= PHOTO_MAX_DISTANCE else 0.0
+    return max(text_score, photo_score)
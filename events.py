@@ -0,0 +1,218 @@
+"""Publish/subscribe broker behind the /api/events Server-Sent Events stream.
+
+Subscribers are open SSE connections, each listening on a few channels
+(e.g. 'user:42', 'admins'). Publishing goes through a backend: the in-process
+backend delivers straight to local subscribers, which is enough for a single
+worker; the PostgreSQL backend sends NOTIFY so that every gunicorn worker
+(each LISTENing on one connection) can deliver to its own subscribers.
+
+Events about a database change are published with publish_on_commit(), so
+they go out only if, and once, the transaction commits. On PostgreSQL the
+NOTIFY is issued on the transaction's own connection, which PostgreSQL
+delivers at commit; the in-process backend holds them in session.info
+until SQLAlchemy's after_commit.
+"""
+import json
+import logging
+import queue
+import select
+import threading
+import time
+
+from sqlalchemy import event as sqlalchemy_event, text
+from sqlalchemy.orm import Session, scoped_session
+
+PG_CHANNEL = 'communitycare_events'
+PG_MAX_PAYLOAD = 7999  # NOTIFY payloads must be shorter than 8000 bytes
+SUBSCRIBER_QUEUE_SIZE = 100
+PENDING_EVENTS = 'pending_events'  # session.info key of the in-process backend's uncommitted events
+
+log = logging.getLogger(__name__)
+
+
+class Subscription:
+    """One SSE connection's view of the broker"""
+
+    def __init__(self, broker, channels):
+        self.broker = broker
+        self.channels = set(channels)
+        self.queue = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+
+    def get(self, timeout=None):
+        """Next (event, data) pair, or None if nothing arrived within timeout"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class EventBroker:
+    def __init__(self, backend=None):
+        self._lock = threading.Lock()
+        self._subscriptions = set()
+        self._observers = []
+        self.backend = backend or InProcessBackend()
+        self.backend.attach(self)
+
+    def subscribe(self, channels):
+        subscription = Subscription(self, channels)
+        with self._lock:
+            self._subscriptions.add(subscription)
+        self.backend.start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def listen(self):
+        """Receive other workers' events for the observers, with or without subscribers"""
+        self.backend.start()
+
+    def watch(self, observer):
+        """Call observer(channel, event, data) for every event delivered to this process"""
+        self._observers.append(observer)
+
+    def publish(self, channel, event, data=None):
+        """Send an event to every subscriber of channel, in any worker"""
+        try:
+            self.backend.publish(channel, event, data or {})
+        except Exception as e:
+            # Push is best effort: clients still catch up through polling
+            log.warning('event publish failed', extra={'channel': channel, 'event': event, 'error': str(e)})
+
+    def publish_on_commit(self, session, channel, event, data=None):
+        """Like publish(), but only once session's transaction commits"""
+        self.backend.publish_on_commit(session, channel, event, data or {})
+
+    def deliver(self, channel, event, data):
+        """Hand an event to the observers and subscribers in this process"""
+        for observer in self._observers:
+            try:
+                observer(channel, event, data)
+            except Exception:
+                log.exception('event observer failed')
+        with self._lock:
+            subscriptions = [s for s in self._subscriptions if channel in s.channels]
+        for subscription in subscriptions:
+            try:
+                subscription.queue.put_nowait((event, data))
+            except queue.Full:
+                # A stalled client shouldn't hold up everyone else
+                pass
+
+
+class InProcessBackend:
+    """Delivers events to subscribers in the publishing process only"""
+
+    def attach(self, broker):
+        self.broker = broker
+
+    def start(self):
+        pass
+
+    def publish(self, channel, event, data):
+        self.broker.deliver(channel, event, data)
+
+    def publish_on_commit(self, session, channel, event, data):
+        if isinstance(session, scoped_session):
+            session = session()
+        if not session.in_transaction():
+            session.begin()  # no connection yet, but now a rollback() before any statement drops the event too
+        session.info.setdefault(PENDING_EVENTS, []).append((self.broker, channel, event, data))
+
+
+@sqlalchemy_event.listens_for(Session, 'after_commit')
+def _deliver_pending_events(session):
+    for broker, channel, event, data in session.info.pop(PENDING_EVENTS, ()):
+        broker.deliver(channel, event, data)
+
+
+@sqlalchemy_event.listens_for(Session, 'after_soft_rollback')
+def _drop_pending_events(session, previous_transaction):
+    # Every rollback() of the session, even one with no statements run yet; not a savepoint's
+    if not previous_transaction.nested:
+        session.info.pop(PENDING_EVENTS, None)
+
+
+class PostgresNotifyBackend:
+    """Fans events out across processes with PostgreSQL LISTEN/NOTIFY.
+
+    The listener thread is started on the first subscription, i.e. inside the
+    worker process that serves the stream, never in a pre-fork master.
+    get_engine() is only called from there and from publish(), so building
+    the backend doesn't touch the engine.
+    """
+
+    def __init__(self, get_engine, poll_interval=5.0):
+        self.get_engine = get_engine
+        self.poll_interval = poll_interval
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def attach(self, broker):
+        self.broker = broker
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._listen_forever, name='event-listener', daemon=True)
+                self._thread.start()
+
+    def publish(self, channel, event, data):
+        payload = self._payload(channel, event, data)
+        if payload is None:
+            return
+        with self.get_engine().connect() as connection:
+            connection.exec_driver_sql('SELECT pg_notify(%s, %s)', (PG_CHANNEL, payload))
+            connection.commit()
+
+    def publish_on_commit(self, session, channel, event, data):
+        # NOTIFY is transactional: it rides on the connection the session already holds, no extra checkout or commit
+        payload = self._payload(channel, event, data)
+        if payload is not None:
+            session.execute(text('SELECT pg_notify(:channel, :payload)'), {'channel': PG_CHANNEL, 'payload': payload})
+
+    def _payload(self, channel, event, data):
+        payload = json.dumps({'channel': channel, 'event': event, 'data': data})
+        if len(payload.encode()) > PG_MAX_PAYLOAD:
+            # Too big for NOTIFY, and failing the statement would abort the caller's transaction
+            log.warning('event too large to publish', extra={'channel': channel, 'event': event})
+            return None
+        return payload
+
+    def _listen_forever(self):
+        while True:
+            try:
+                self._listen()
+            except Exception as e:
+                log.warning('event listener lost its connection', extra={'error': str(e)})
+                time.sleep(self.poll_interval)
+
+    def _listen(self):
+        raw = self.get_engine().raw_connection()
+        try:
+            conn = raw.driver_connection
+            conn.autocommit = True
+            with conn.cursor() as cursor:
+                cursor.execute(f'LISTEN {PG_CHANNEL}')
+            while True:
+                if select.select([conn], [], [], self.poll_interval) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    notify = conn.notifies.pop(0)
+                    message = json.loads(notify.payload)
+                    self.broker.deliver(message['channel'], message['event'], message['data'])
+        finally:
+            raw.invalidate()
+
+
+def format_sse(event, data):
+    """Encode one Server-Sent Events frame"""
+    return f'event: {event}\ndata: {json.dumps(data)}\n\n'
@@ -0,0 +1,110 @@
+"""Geohash indexing for report coordinates.
+
+Each report with coordinates stores its geohash as a 52-bit integer (26 bits
+of longitude interleaved with 26 bits of latitude, about 0.6 m cells). It is
+the same cell hierarchy as a base32 geohash, but every geohash prefix becomes
+a plain integer range, so a normal B-tree index serves bounding-box lookups
+and GROUP BY geohash // 2**k clusters reports into coarser cells. That works
+the same on PostgreSQL and SQLite and needs no PostGIS.
+"""
+import math
+
+GEOHASH_BITS = 52
+EARTH_RADIUS_KM = 6371.0088
+MAX_COVER_CELLS = 16
+
+
+def valid_coordinates(latitude, longitude):
+    return -90.0 <= latitude <= 90.0 and -180.0 <= longitude <= 180.0
+
+
+def _axis_bits(bits):
+    """(longitude bits, latitude bits) of a cell bits deep; longitude goes first"""
+    return (bits + 1) // 2, bits // 2
+
+
+def _axis_index(value, low, high, bits):
+    return min(int((value - low) / (high - low) * (1 << bits)), (1 << bits) - 1)
+
+
+def _interleave(lon_index, lat_index, bits):
+    lon_bits, lat_bits = _axis_bits(bits)
+    cell = 0
+    for i in range(bits):
+        if i % 2 == 0:
+            bit = (lon_index >> (lon_bits - 1 - i // 2)) & 1
+        else:
+            bit = (lat_index >> (lat_bits - 1 - i // 2)) & 1
+        cell = (cell << 1) | bit
+    return cell
+
+
+def encode(latitude, longitude, bits=GEOHASH_BITS):
+    """Integer geohash of a point, bits deep"""
+    lon_bits, lat_bits = _axis_bits(bits)
+    return _interleave(_axis_index(longitude, -180.0, 180.0, lon_bits),
+                       _axis_index(latitude, -90.0, 90.0, lat_bits), bits)
+
+
+def cell_range(cell, bits):
+    """[low, high) range of full-precision geohashes inside a cell bits deep"""
+    shift = GEOHASH_BITS - bits
+    return cell << shift, (cell + 1) << shift
+
+
+def covering_ranges(south, west, north, east, max_cells=MAX_COVER_CELLS):
+    """Merged geohash ranges of the finest grid that covers the box in at most max_cells cells.
+
+    The cells overshoot the box, so filter on the coordinates as well. A box
+    with west > east crosses the antimeridian.
+    """
+    if west > east:
+        return (covering_ranges(south, west, north, 180.0, max_cells // 2)
+                + covering_ranges(south, -180.0, north, east, max_cells // 2))
+
+    cells = [0]
+    bits = 0
+    for depth in range(1, GEOHASH_BITS + 1):
+        lon_bits, lat_bits = _axis_bits(depth)
+        lon_range = range(_axis_index(west, -180.0, 180.0, lon_bits), _axis_index(east, -180.0, 180.0, lon_bits) + 1)
+        lat_range = range(_axis_index(south, -90.0, 90.0, lat_bits), _axis_index(north, -90.0, 90.0, lat_bits) + 1)
+        if len(lon_range) * len(lat_range) > max_cells:
+            break
+        cells = [_interleave(x, y, depth) for x in lon_range for y in lat_range]
+        bits = depth
+
+    ranges = []
+    for low, high in sorted(cell_range(cell, bits) for cell in cells):
+        if ranges and ranges[-1][1] == low:
+            ranges[-1] = (ranges[-1][0], high)
+        else:
+            ranges.append((low, high))
+    return ranges
+
+
+def cluster_bits(zoom):
+    """Geohash depth of the clusters for a web map zoom level (about 4x4 clusters per 256px tile)"""
+    return max(2, min(GEOHASH_BITS, 2 * (int(zoom) + 2)))
+
+
+def distance_km(lat1, lon1, lat2, lon2):
+    """Great-circle (haversine) distance"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def box_around(latitude, longitude, radius_km):
+    """(south, west, north, east) of a box containing every point within radius_km"""
+    dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    south, north = max(-90.0, latitude - dlat), min(90.0, latitude + dlat)
+    if south == -90.0 or north == 90.0:
+        return south, -180.0, north, 180.0
+    dlon = math.degrees(radius_km / (EARTH_RADIUS_KM * math.cos(math.radians(latitude))))
+    if dlon >= 180.0:
+        return south, -180.0, north, 180.0
+    west = longitude - dlon if longitude - dlon >= -180.0 else longitude - dlon + 360.0
+    east = longitude + dlon if longitude + dlon <= 180.0 else longitude + dlon - 360.0
+    return south, west, north, east
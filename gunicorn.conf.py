@@ -0,0 +1,51 @@
+"""Gunicorn settings, picked up automatically by `gunicorn app:app`.
+
+The app is imported once in the master (preload_app) and the workers fork
+from it, so a cold start pays for the import only once. create_app() opens
+no connections and starts no threads, and post_fork() drops any pooled
+connection the master may have opened anyway, so workers never share one.
+"""
+import multiprocessing
+import os
+import tempfile
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+
+# gthread workers: requests mostly wait on the database and SSE streams sit idle.
+# Workers are capped because each one holds its own pool and copy of the app in memory.
+cpus = multiprocessing.cpu_count()
+worker_class = 'gthread'
+workers = int(os.environ.get('WEB_CONCURRENCY', min(cpus * 2 + 1, 4)))
+threads = int(os.environ.get('GUNICORN_THREADS', max(8, cpus * 4)))
+
+preload_app = True
+timeout = 60
+graceful_timeout = 30
+keepalive = 5
+
+accesslog = '-'
+errorlog = '-'
+
+# Each worker writes its metrics here so /metrics can add them up (see metrics.py).
+# Set before the app is imported, which reads it in load_config().
+os.environ.setdefault('METRICS_DIR', os.path.join(tempfile.gettempdir(), f'communitycare-metrics-{os.getuid()}'))
+
+# Open /api/events streams per worker (see load_config()): half the threads, so requests always get the rest
+os.environ.setdefault('SSE_MAX_STREAMS', str(max(1, threads // 2)))
+
+
+def on_starting(server):
+    import metrics
+    metrics.clear_directory(os.environ['METRICS_DIR'])
+
+
+def post_fork(server, worker):
+    from app import app, db
+    with app.app_context():
+        # close=False: leave the master's sockets alone, just forget them in this worker
+        db.engine.dispose(close=False)
+
+
+def child_exit(server, worker):
+    import metrics
+    metrics.mark_process_dead(os.environ['METRICS_DIR'], worker.pid)
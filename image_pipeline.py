@@ -0,0 +1,118 @@
+"""Background image processing for uploaded report photos.
+
+Decoding and re-encoding JPEGs is CPU heavy, so it runs in a process pool
+rather than on the request thread. Dispatcher threads, one per worker
+process, each wait on one job at a time and hand its result back to the app
+through a callback.
+"""
+import io
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from PIL import Image, ImageOps
+
+# Refuse absurdly large uploads before decoding them (decompression bombs)
+Image.MAX_IMAGE_PIXELS = 50_000_000
+
+DEFAULT_MAX_DIMENSION = 2048
+DEFAULT_JPEG_QUALITY = 82
+DEFAULT_THUMBNAIL_SIZES = {'small': 160, 'medium': 480}
+
+
+def _encode_jpeg(image, quality):
+    buf = io.BytesIO()
+    # No exif= argument, so location and camera metadata are dropped
+    image.save(buf, 'JPEG', quality=quality, optimize=True, progressive=True)
+    return buf.getvalue()
+
+
+def process_image(source, max_dimension=DEFAULT_MAX_DIMENSION, quality=DEFAULT_JPEG_QUALITY,
+                  thumbnail_sizes=None):
+    """Downscale, strip metadata and re-encode an image, plus thumbnails.
+
+    source is raw image bytes or a file path. Returns a dict of variant
+    name -> JPEG bytes, with the full-size image under 'original'. Runs inside
+    a worker process, so it only deals in picklable values.
+    """
+    thumbnail_sizes = thumbnail_sizes or DEFAULT_THUMBNAIL_SIZES
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+
+    with Image.open(source) as original:
+        # Bake in the camera orientation before the EXIF tag is thrown away
+        image = ImageOps.exif_transpose(original)
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+
+    image.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS)
+    variants = {'original': _encode_jpeg(image, quality)}
+
+    for name, size in thumbnail_sizes.items():
+        thumb = image.copy()
+        thumb.thumbnail((size, size), Image.Resampling.LANCZOS)
+        variants[name] = _encode_jpeg(thumb, quality)
+
+    return variants
+
+
+class ImagePipeline:
+    """Runs process_image off the request thread.
+
+    on_complete(job_id, variants) is called from a dispatcher thread when a
+    job finishes; on_error(job_id, exc) when it fails. Up to workers images
+    are processed at once. With workers=0 the processing happens on a single
+    dispatcher thread itself (handy for SQLite and one-off CLI runs). Executors are created lazily so that nothing is started
+    in a gunicorn master before it forks.
+    """
+
+    def __init__(self, on_complete, on_error=None, workers=2, max_dimension=DEFAULT_MAX_DIMENSION,
+                 quality=DEFAULT_JPEG_QUALITY, thumbnail_sizes=None):
+        self.on_complete = on_complete
+        self.on_error = on_error
+        self.workers = workers
+        self.options = {
+            'max_dimension': max_dimension,
+            'quality': quality,
+            'thumbnail_sizes': thumbnail_sizes or DEFAULT_THUMBNAIL_SIZES,
+        }
+        self._lock = threading.Lock()
+        self._process_pool = None
+        self._dispatcher = None
+
+    def _executors(self):
+        with self._lock:
+            if self._dispatcher is None:
+                if self.workers > 0:
+                    # Forking a threaded web worker can copy held locks; start from a clean server process
+                    self._process_pool = ProcessPoolExecutor(max_workers=self.workers,
+                                                             mp_context=multiprocessing.get_context('forkserver'))
+                # One waiting thread per process, so every process can be busy
+                self._dispatcher = ThreadPoolExecutor(max_workers=max(1, self.workers),
+                                                      thread_name_prefix='image-pipeline')
+            return self._process_pool, self._dispatcher
+
+    def _run(self, job_id, source):
+        try:
+            if self._process_pool is not None:
+                variants = self._process_pool.submit(process_image, source, **self.options).result()
+            else:
+                variants = process_image(source, **self.options)
+            self.on_complete(job_id, variants)
+        except Exception as e:
+            if self.on_error:
+                self.on_error(job_id, e)
+
+    def submit(self, job_id, source):
+        """Queue an image (bytes or file path) for processing and return the dispatcher future"""
+        _, dispatcher = self._executors()
+        return dispatcher.submit(self._run, job_id, source)
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            if self._dispatcher is not None:
+                self._dispatcher.shutdown(wait=wait)
+            if self._process_pool is not None:
+                self._process_pool.shutdown(wait=wait)
+            self._process_pool = None
+            self._dispatcher = None
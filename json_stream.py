@@ -0,0 +1,39 @@
+"""Streaming JSON responses for large lists.
+
+Instead of building every row into one big list and encoding it in one go,
+stream_json_list() yields the envelope and then one encoded row at a time, so
+a response's memory use doesn't grow with the number of rows and the client
+gets the first bytes before the last row has been read. Rows are encoded with
+orjson when it is installed and the standard json module otherwise.
+"""
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+import json
+
+
+def dumps(value):
+    """Encode value as compact JSON bytes"""
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, separators=(',', ':')).encode()
+
+
+def stream_json_list(envelope, key, rows, serialize):
+    """Yield {**envelope, key: [serialize(row) for row in rows]} as JSON chunks.
+
+    rows is consumed lazily (e.g. a query with yield_per), so each row is
+    loaded, encoded and handed to the server before the next one is read.
+    """
+    head = dumps(envelope)
+    if envelope:
+        yield head[:-1] + b',' + dumps(key) + b':['
+    else:
+        yield b'{' + dumps(key) + b':['
+    first = True
+    for row in rows:
+        chunk = dumps(serialize(row))
+        yield chunk if first else b',' + chunk
+        first = False
+    yield b']}'
@@ -0,0 +1,198 @@
+"""Structured logging that never makes a request wait on stderr.
+
+configure() puts one QueueHandler on the root logger. A log call in a
+request thread only builds the record, tags it with the current request id
+and route (see bind_request()) and puts it on a bounded queue; a writer
+thread turns records into JSON lines and writes them out in batches. When
+the queue is full the record is dropped instead of blocking, and the next
+line written says how many were lost.
+
+High-volume events opt into sampling by passing their rate in extra, e.g.
+log.info('request', extra={'sample_rate': 0.01}) keeps about one in a
+hundred; kept records carry the rate so counts can be scaled back up.
+Levels can be changed while running with set_level().
+
+The writer starts with the first record a process logs, and a forked child
+(a gunicorn worker) starts over with an empty queue and its own writer.
+"""
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+from json_stream import dumps
+
+QUEUE_SIZE = 10000
+WRITE_BATCH = 256
+LEVELS = ('DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL')
+
+# Attributes every LogRecord has; anything else on a record came from extra=
+_RECORD_ATTRIBUTES = frozenset(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+_request = ContextVar('log_request', default=None)
+
+
+def bind_request(request_id, route):
+    """Tag records logged in this context with request_id and route; returns a token for unbind_request()"""
+    return _request.set((request_id, route))
+
+
+def unbind_request(token):
+    _request.reset(token)
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: ts, level, logger, msg, request_id, route and any extra fields"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exc'] = record.exc_text
+        try:
+            return dumps(entry).decode()
+        except TypeError:
+            return dumps({key: value if isinstance(value, (str, int, float, bool, type(None))) else str(value)
+                          for key, value in entry.items()}).decode()
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps a record with a sample_rate extra with that probability"""
+
+    def filter(self, record):
+        rate = getattr(record, 'sample_rate', None)
+        return rate is None or rate >= 1 or random.random() < rate
+
+
+class AsyncHandler(logging.handlers.QueueHandler):
+    """Hands records to a writer thread through a bounded queue, dropping them when it is full"""
+
+    def __init__(self, stream=None, queue_size=QUEUE_SIZE):
+        super().__init__(queue.Queue(queue_size))
+        self.queue_size = queue_size
+        self.stream = stream
+        self.dropped = 0
+        self.setFormatter(JsonFormatter())
+        self.addFilter(SamplingFilter())
+        self._writer = None
+        self._start_lock = threading.Lock()
+        os.register_at_fork(after_in_child=self._forget_parent)
+
+    def prepare(self, record):
+        # Formatting waits for the writer; only freeze the message, since its args may change after this
+        context = _request.get()
+        if context is not None:
+            record.request_id, record.route = context
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        if self._writer is None:
+            self._start()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def _start(self):
+        with self._start_lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_forever, args=(self.queue,),
+                                                name='log-writer', daemon=True)
+                self._writer.start()
+
+    def _forget_parent(self):
+        # The parent's writer didn't survive the fork and its queue may be mid-update
+        self.queue = queue.Queue(self.queue_size)
+        self.dropped = 0
+        self._writer = None
+        self._start_lock = threading.Lock()
+
+    def _write_forever(self, records):
+        while True:
+            batch = [records.get()]
+            while len(batch) < WRITE_BATCH:
+                try:
+                    batch.append(records.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in batch
+            lines = [self.format(record) for record in batch if record is not None]
+            if self.dropped:
+                dropped, self.dropped = self.dropped, 0
+                lines.append(self.format(logging.makeLogRecord({
+                    'name': __name__, 'levelno': logging.WARNING, 'levelname': 'WARNING',
+                    'msg': 'log records dropped, queue full', 'dropped': dropped,
+                })))
+            if lines:
+                try:
+                    stream = self.stream or sys.stderr
+                    stream.write('\n'.join(lines) + '\n')
+                    stream.flush()
+                except Exception:
+                    pass  # nowhere left to report it
+            if stop:
+                return
+
+    def close(self):
+        """Write out what is queued, waiting up to a second"""
+        writer = self._writer
+        if writer is not None and writer.is_alive():
+            try:
+                self.queue.put(None, timeout=1)
+                writer.join(timeout=1)
+            except queue.Full:
+                pass
+        self._writer = None
+        super().close()
+
+
+def configure(level='INFO', stream=None, queue_size=QUEUE_SIZE):
+    """Send every log record through one AsyncHandler on the root logger"""
+    # Skip what the JSON lines don't use: the caller's file and line, thread and process names
+    logging._srcfile = None
+    logging.logThreads = False
+    logging.logProcesses = False
+    logging.logMultiprocessing = False
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        if isinstance(handler, AsyncHandler):
+            root.removeHandler(handler)
+            handler.close()
+    handler = AsyncHandler(stream, queue_size)
+    root.addHandler(handler)
+    root.setLevel(level.upper())
+    atexit.register(handler.close)
+    return handler
+
+
+def set_level(level, logger=None):
+    """Set the level of logger (the root logger by default); raises ValueError for an unknown level"""
+    level = str(level).upper()
+    if level not in LEVELS:
+        raise ValueError(f'Unknown log level {level!r}, expected one of {", ".join(LEVELS)}')
+    logging.getLogger(None if logger in (None, '', 'root') else logger).setLevel(level)
+
+
+def levels():
+    """{logger: level} of the root logger and every logger with a level of its own"""
+    current = {'root': logging.getLevelName(logging.getLogger().level)}
+    for name, logger in sorted(logging.Logger.manager.loggerDict.items()):
+        if isinstance(logger, logging.Logger) and logger.level != logging.NOTSET:
+            current[name] = logging.getLevelName(logger.level)
+    return current
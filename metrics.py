@@ -0,0 +1,394 @@
+"""Request, database and pool metrics in the Prometheus text format.
+
+Metrics live in plain dicts in each process and are updated under one lock,
+which keeps the cost per request to a few microseconds. For /metrics to
+cover every gunicorn worker, each process also writes a snapshot of its
+values to <directory>/<pid>.json every few seconds; rendering sums the
+snapshots of the other processes with this process's live values. When a
+worker exits, mark_process_dead() folds its counters and histograms into
+dead.json and drops its gauges, so totals never go backwards while it
+restarts. Without a directory (a single process, e.g. `flask run`) no files
+are written.
+
+MetricsMiddleware times each request from the moment it reaches the app
+until its body has been sent, so streamed lists and exports are measured in
+full. Engine events add up the SQL statements of the request running in the
+current thread, and TimedQueuePool measures how long checkouts wait for a
+free connection.
+"""
+import atexit
+import bisect
+import glob
+import json
+import logging
+import os
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.dialects import plugins
+from sqlalchemy.engine import CreateEnginePlugin
+from sqlalchemy.pool import QueuePool
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+POOL_WAIT_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0)
+SNAPSHOT_INTERVAL = 5.0
+DEAD_SNAPSHOT = 'dead.json'
+
+log = logging.getLogger(__name__)
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = []
+        self.directory = None
+        self._writer = None
+
+    def add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def snapshot(self):
+        """{name: [[labels, value], ...]} of this process's current values"""
+        with self.lock:
+            return {metric.name: [[list(labels), value] for labels, value in metric.dump()]
+                    for metric in self.metrics}
+
+    def write_snapshot(self):
+        if not self.directory:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f'{os.getpid()}.json')
+        with open(f'{path}.tmp', 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(f'{path}.tmp', path)
+
+    def ensure_writer(self):
+        """Start the thread that keeps this process's snapshot file fresh"""
+        if not self.directory or (self._writer is not None and self._writer.is_alive()):
+            return
+        with self.lock:
+            if self._writer is None or not self._writer.is_alive():
+                self._writer = threading.Thread(target=self._write_periodically, name='metrics-writer', daemon=True)
+                self._writer.start()
+                atexit.register(self.write_snapshot)
+
+    def _write_periodically(self):
+        while True:
+            time.sleep(SNAPSHOT_INTERVAL)
+            try:
+                self.write_snapshot()
+            except OSError as e:
+                log.warning('could not write metrics snapshot', extra={'error': str(e)})
+
+    def collect(self):
+        """This process's live values plus the latest snapshots of every other process"""
+        snapshots = [self.snapshot()]
+        if self.directory:
+            own = f'{os.getpid()}.json'
+            for path in glob.glob(os.path.join(self.directory, '*.json')):
+                if os.path.basename(path) == own:
+                    continue
+                try:
+                    with open(path) as f:
+                        snapshots.append(json.load(f))
+                except (OSError, ValueError):
+                    continue  # a worker that just exited
+        totals = {}
+        for metric in self.metrics:
+            merged = {}
+            for snapshot in snapshots:
+                for labels, value in snapshot.get(metric.name, []):
+                    key = tuple(labels)
+                    merged[key] = metric.merge(merged.get(key), value)
+            totals[metric.name] = merged
+        return totals
+
+    def render(self):
+        """Every metric in the Prometheus text exposition format"""
+        totals = self.collect()
+        lines = []
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            for labels, value in sorted(totals[metric.name].items()):
+                lines.extend(metric.render(labels, value))
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _label_text(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Counter:
+    type = 'counter'
+
+    def __init__(self, registry, name, help, labels=()):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values = {}
+        registry.add(self)
+
+    def inc(self, labels=(), amount=1):
+        with self.registry.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def inc_locked(self, labels=(), amount=1):
+        """inc() for a caller already holding registry.lock"""
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def dump(self):
+        return self.values.items()
+
+    def merge(self, total, value):
+        return value if total is None else total + value
+
+    def render(self, labels, value):
+        return [f'{self.name}{_label_text(self.labels, labels)} {_number(value)}']
+
+
+class Gauge(Counter):
+    """A per-process value (e.g. requests in flight); processes add up, dead ones drop out"""
+    type = 'gauge'
+
+
+class Histogram:
+    type = 'histogram'
+
+    def __init__(self, registry, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self.values = {}  # labels -> [count per bucket..., +Inf count, sum]
+        registry.add(self)
+
+    def observe(self, labels, value):
+        with self.registry.lock:
+            _add(self.series_locked(labels), self.buckets, value)
+
+    def series_locked(self, labels):
+        """The bucket list of one label set, for a caller holding registry.lock"""
+        counts = self.values.get(labels)
+        if counts is None:
+            counts = self.values[labels] = [0] * (len(self.buckets) + 2)
+        return counts
+
+    def dump(self):
+        return [(labels, list(counts)) for labels, counts in self.values.items()]
+
+    def merge(self, total, value):
+        return list(value) if total is None else [a + b for a, b in zip(total, value)]
+
+    def render(self, labels, counts):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + ('+Inf',), counts):
+            cumulative += count
+            le = 'le="%s"' % bound
+            lines.append(f'{self.name}_bucket{_label_text(self.labels, labels, le)} {cumulative}')
+        lines.append(f'{self.name}_sum{_label_text(self.labels, labels)} {_number(counts[-1])}')
+        lines.append(f'{self.name}_count{_label_text(self.labels, labels)} {cumulative}')
+        return lines
+
+
+def _add(counts, buckets, value):
+    counts[bisect.bisect_left(buckets, value)] += 1
+    counts[-1] += value
+
+
+def mark_process_dead(directory, pid):
+    """Fold a dead worker's counters and histograms into dead.json (gunicorn child_exit hook)"""
+    path = os.path.join(directory, f'{pid}.json')
+    try:
+        with open(path) as f:
+            snapshot = json.load(f)
+    except (OSError, ValueError):
+        return
+    dead_path = os.path.join(directory, DEAD_SNAPSHOT)
+    try:
+        with open(dead_path) as f:
+            dead = json.load(f)
+    except (OSError, ValueError):
+        dead = {}
+    for metric in REGISTRY.metrics:
+        if metric.type == 'gauge' or metric.name not in snapshot:
+            continue
+        merged = {tuple(labels): value for labels, value in dead.get(metric.name, [])}
+        for labels, value in snapshot[metric.name]:
+            merged[tuple(labels)] = metric.merge(merged.get(tuple(labels)), value)
+        dead[metric.name] = [[list(labels), value] for labels, value in merged.items()]
+    with open(f'{dead_path}.tmp', 'w') as f:
+        json.dump(dead, f)
+    os.replace(f'{dead_path}.tmp', dead_path)
+    os.remove(path)
+
+
+def clear_directory(directory):
+    """Forget the previous server run's snapshots (gunicorn on_starting hook)"""
+    for path in glob.glob(os.path.join(directory, '*.json')):
+        os.remove(path)
+
+
+REGISTRY = Registry()
+
+REQUESTS = Counter(REGISTRY, 'http_requests_total', 'Requests by endpoint, method and status',
+                   ('endpoint', 'method', 'status'))
+REQUEST_LATENCY = Histogram(REGISTRY, 'http_request_duration_seconds',
+                            'Time from receiving a request until its body was sent', ('endpoint', 'method'))
+IN_FLIGHT = Gauge(REGISTRY, 'http_requests_in_flight', 'Requests being served')
+RESPONSE_SIZE = Histogram(REGISTRY, 'http_response_size_bytes', 'Response body sizes',
+                          ('endpoint', 'method'), SIZE_BUCKETS)
+REQUEST_QUERIES = Histogram(REGISTRY, 'db_queries_per_request', 'SQL statements run per request',
+                            ('endpoint', 'method'), QUERY_COUNT_BUCKETS)
+REQUEST_QUERY_TIME = Histogram(REGISTRY, 'db_query_seconds_per_request', 'Time spent in SQL per request',
+                               ('endpoint', 'method'))
+PER_REQUEST = (REQUEST_LATENCY, RESPONSE_SIZE, REQUEST_QUERIES, REQUEST_QUERY_TIME)  # order used by finish()
+QUERIES = Counter(REGISTRY, 'db_queries_total', 'SQL statements run, in requests or not')
+QUERY_TIME = Counter(REGISTRY, 'db_query_seconds_total', 'Time spent in SQL, in requests or not')
+POOL_WAIT = Histogram(REGISTRY, 'db_pool_checkout_wait_seconds', 'Time spent waiting for a pooled connection',
+                      buckets=POOL_WAIT_BUCKETS)
+
+_current = threading.local()  # SQL totals of the request this thread is serving
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited (including connecting)"""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            POOL_WAIT.observe((), time.perf_counter() - started)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('metrics_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['metrics_started'].pop()
+    QUERIES.inc()
+    QUERY_TIME.inc(amount=elapsed)
+    totals = getattr(_current, 'queries', None)
+    if totals is not None:
+        totals[0] += 1
+        totals[1] += elapsed
+
+
+def instrument_engine(engine):
+    """Count and time every statement the engine runs"""
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+
+class EngineInstrumentation(CreateEnginePlugin):
+    """create_engine() plugin that calls each of its instruments=[...] with the new engine.
+
+    Enabled with the engine options plugins=['instrumentation'], so the engine
+    is instrumented as it is created instead of being looked up afterwards.
+    """
+
+    def __init__(self, url, kwargs):
+        super().__init__(url, kwargs)
+        self.instruments = kwargs.pop('instruments', ())
+
+    def update_url(self, url):
+        return url  # takes nothing from the URL
+
+    def engine_created(self, engine):
+        for instrument in self.instruments:
+            instrument(engine)
+
+
+plugins.register('instrumentation', __name__, 'EngineInstrumentation')
+
+
+class MetricsMiddleware:
+    """WSGI middleware recording latency, status, size and SQL totals for each request.
+
+    The Flask endpoint name is read from environ['metrics.endpoint'], which
+    the app sets once it has matched the URL; unmatched URLs count as
+    'unmatched' so the label set stays small.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._series = {}  # (endpoint, method) -> bucket lists of the per-request histograms
+
+    def __call__(self, environ, start_response):
+        recorded = _RecordedRequest(self, environ, start_response)
+        _current.queries = [0, 0.0]
+        with REGISTRY.lock:
+            IN_FLIGHT.inc_locked()
+        try:
+            recorded.body = self.app(environ, recorded.start_response)
+        except BaseException:
+            self.finish(recorded)
+            raise
+        return recorded
+
+    def finish(self, recorded):
+        elapsed = time.perf_counter() - recorded.started
+        key = (recorded.environ.get('metrics.endpoint', 'unmatched'), recorded.environ.get('REQUEST_METHOD', ''))
+        queries = _current.queries or [0, 0.0]
+        _current.queries = None
+        # One lock round trip and one series lookup for the whole request
+        with REGISTRY.lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [histogram.series_locked(key) for histogram in PER_REQUEST]
+            IN_FLIGHT.inc_locked(amount=-1)
+            REQUESTS.inc_locked(key + (recorded.status,))
+            _add(series[0], LATENCY_BUCKETS, elapsed)
+            _add(series[1], SIZE_BUCKETS, recorded.size)
+            _add(series[2], QUERY_COUNT_BUCKETS, queries[0])
+            _add(series[3], LATENCY_BUCKETS, queries[1])
+
+
+class _RecordedRequest:
+    """Passes the response through, noting its status and size, and records it on close()"""
+    __slots__ = ('middleware', 'environ', '_start_response', 'started', 'status', 'size', 'body')
+
+    def __init__(self, middleware, environ, start_response):
+        self.middleware = middleware
+        self.environ = environ
+        self._start_response = start_response
+        self.started = time.perf_counter()
+        self.status = '500'
+        self.size = 0
+        self.body = ()
+
+    def start_response(self, status, headers, exc_info=None):
+        self.status = status[:3]
+        return self._start_response(status, headers, exc_info)
+
+    def __iter__(self):
+        for chunk in self.body:
+            self.size += len(chunk)
+            yield chunk
+
+    def close(self):
+        try:
+            if hasattr(self.body, 'close'):
+                self.body.close()
+        finally:
+            self.middleware.finish(self)
@@ -0,0 +1,266 @@
+"""Versioned schema migrations.
+
+Run once per deploy with `flask --app app migrate`, never at import time.
+Applied versions are recorded in schema_migrations; each migration runs in its
+own transaction. Migrations are written to be safe on databases that were
+set up by the old import-time column checks, so existing deployments simply
+record them as applied.
+"""
+from datetime import datetime
+
+from sqlalchemy import inspect, text
+
+import dedup
+import geo
+import retention
+from search import ensure_search_schema
+
+MIGRATIONS = []
+
+MIGRATION_LOCK_ID = 7240115  # arbitrary key for pg_advisory_xact_lock
+
+
+def migration(version, description):
+    def register(fn):
+        MIGRATIONS.append((version, description, fn))
+        return fn
+    return register
+
+
+def add_column_if_missing(connection, table, column, ddl):
+    columns = [col['name'] for col in inspect(connection).get_columns(table)]
+    if column in columns:
+        return False
+    connection.execute(text(f'ALTER TABLE {table} ADD COLUMN {column} {ddl}'))
+    return True
+
+
+@migration(1, 'create tables')
+def create_tables(connection, metadata):
+    metadata.create_all(connection, checkfirst=True)
+
+
+@migration(2, 'report resolution columns')
+def report_resolution_columns(connection, metadata):
+    add_column_if_missing(connection, 'reports', 'resolution_notes', 'TEXT')
+    add_column_if_missing(connection, 'reports', 'resolved_by', 'INTEGER REFERENCES users(id)')
+    add_column_if_missing(connection, 'reports', 'auditor_name', 'VARCHAR(100)')
+    add_column_if_missing(connection, 'reports', 'resolved_at', 'TIMESTAMP')
+
+
+@migration(3, 'photo store columns')
+def photo_store_columns(connection, metadata):
+    for column in ('photo_hash', 'photo_small_hash', 'photo_medium_hash'):
+        add_column_if_missing(connection, 'reports', column, 'VARCHAR(64)')
+
+
+@migration(4, 'updated_at columns')
+def updated_at_columns(connection, metadata):
+    # Backfill from the last change we know about
+    for table, backfill in (('reports', 'COALESCE(resolved_at, created_at)'),
+                            ('notifications', 'created_at')):
+        if add_column_if_missing(connection, table, 'updated_at', 'TIMESTAMP'):
+            connection.execute(text(f'UPDATE {table} SET updated_at = {backfill}'))
+
+
+@migration(5, 'full-text search')
+def full_text_search(connection, metadata):
+    ensure_search_schema(connection)
+
+
+@migration(6, 'seed report counters')
+def seed_report_counters(connection, metadata):
+    if connection.execute(text('SELECT 1 FROM report_counters LIMIT 1')).first():
+        return
+    connection.execute(text("""
+        INSERT INTO report_counters (user_id, status, count)
+        SELECT user_id, COALESCE(status, 'Pending'), COUNT(*) FROM reports
+        GROUP BY user_id, COALESCE(status, 'Pending')
+    """))
+    connection.execute(text("""
+        INSERT INTO report_counters (user_id, status, count)
+        SELECT 0, COALESCE(status, 'Pending'), COUNT(*) FROM reports
+        GROUP BY COALESCE(status, 'Pending')
+    """))
+
+
+# Each index serves specific routes:
+ROUTE_INDEXES = [
+    # /api/user_reports, /api/reports and /api/stats reconciliation for one user, newest first
+    ('ix_reports_user_created', 'reports', 'user_id, created_at, id'),
+    # /api/all_reports, admin /api/reports keyset pages, /api/new_reports_count
+    ('ix_reports_created', 'reports', 'created_at, id'),
+    # /api/reports?status=... pages
+    ('ix_reports_status_created', 'reports', 'status, created_at, id'),
+    # ETag and ?since= lookups: max(updated_at) per user and overall
+    ('ix_reports_user_updated', 'reports', 'user_id, updated_at'),
+    ('ix_reports_updated', 'reports', 'updated_at'),
+    # Image pipeline check for other reports sharing a photo
+    ('ix_reports_photo_hash', 'reports', 'photo_hash'),
+    # /api/notifications_count
+    ('ix_notifications_user_unread', 'notifications', 'user_id, is_read'),
+    # /api/notifications list, ETag and ?since=
+    ('ix_notifications_user_created', 'notifications', 'user_id, created_at'),
+    ('ix_notifications_user_updated', 'notifications', 'user_id, updated_at'),
+    # Deleting a report's notifications
+    ('ix_notifications_report', 'notifications', 'report_id'),
+    # /api/admin_audit_logs
+    ('ix_admin_logs_created', 'admin_logs', 'created_at'),
+    # Admin notification fan-out in submit_report
+    ('ix_users_role', 'users', 'role'),
+    # ?since= tombstone lookups
+    ('ix_deleted_records_table_deleted', 'deleted_records', 'table_name, deleted_at'),
+]
+
+# Added later, so they are created by their own migrations:
+RETENTION_INDEXES = [
+    # Retention of read notifications, oldest first (see retention.py)
+    ('ix_notifications_read_created', 'notifications', 'is_read, created_at'),
+]
+PHOTO_INDEXES = [
+    # Finding unreferenced photo blobs (collect_unreferenced_photos() in app.py)
+    ('ix_reports_photo_small_hash', 'reports', 'photo_small_hash'),
+    ('ix_reports_photo_medium_hash', 'reports', 'photo_medium_hash'),
+]
+
+
+@migration(7, 'route indexes')
+def route_indexes(connection, metadata):
+    for name, table, columns in ROUTE_INDEXES:
+        connection.execute(text(f'CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})'))
+
+
+@migration(8, 'report geohash')
+def report_geohash(connection, metadata):
+    add_column_if_missing(connection, 'reports', 'geohash', 'BIGINT')
+    located = connection.execute(text(
+        'SELECT id, latitude, longitude FROM reports '
+        'WHERE latitude IS NOT NULL AND longitude IS NOT NULL AND geohash IS NULL'
+    )).all()
+    updates = [{'id': row.id, 'geohash': geo.encode(row.latitude, row.longitude)}
+               for row in located if geo.valid_coordinates(row.latitude, row.longitude)]
+    if updates:
+        connection.execute(text('UPDATE reports SET geohash = :geohash WHERE id = :id'), updates)
+    # /api/reports/within, /nearest and /clusters
+    connection.execute(text('CREATE INDEX IF NOT EXISTS ix_reports_geohash ON reports (geohash)'))
+
+
+@migration(9, 'near-duplicate detection')
+def near_duplicate_detection(connection, metadata):
+    add_column_if_missing(connection, 'reports', 'photo_dhash', 'BIGINT')
+    add_column_if_missing(connection, 'reports', 'duplicate_of', 'INTEGER REFERENCES reports(id)')
+    add_column_if_missing(connection, 'reports', 'duplicate_status', 'VARCHAR(20)')
+    metadata.tables['report_dedup_bands'].create(connection, checkfirst=True)
+    # Index the reports that new submissions could still be matched against
+    if connection.execute(text('SELECT 1 FROM report_dedup_bands LIMIT 1')).first():
+        return
+    open_reports = connection.execute(text(
+        "SELECT id, issue, location FROM reports WHERE status IS NULL OR status != 'Resolved'"
+    ))
+    rows = [{'band': band, 'bucket': bucket, 'report_id': row.id}
+            for row in open_reports
+            for band, bucket in dedup.text_buckets(dedup.minhash(f'{row.issue} {row.location}'))]
+    if rows:
+        connection.execute(text(
+            'INSERT INTO report_dedup_bands (band, bucket, report_id) VALUES (:band, :bucket, :report_id)'
+        ), rows)
+
+
+@migration(10, 'unread notification counters')
+def unread_notification_counters(connection, metadata):
+    if add_column_if_missing(connection, 'users', 'unread_notifications', 'INTEGER NOT NULL DEFAULT 0'):
+        connection.execute(text("""
+            UPDATE users SET unread_notifications = (
+                SELECT COUNT(*) FROM notifications
+                WHERE notifications.user_id = users.id AND notifications.is_read = false
+            )
+        """))
+
+
+@migration(11, 'retention archive tables')
+def retention_archive_tables(connection, metadata):
+    for name, table, columns in RETENTION_INDEXES:
+        connection.execute(text(f'CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})'))
+    retention.archive_table(metadata.tables['notifications']).create(connection, checkfirst=True)
+    if connection.dialect.name == 'postgresql':
+        partition_admin_logs(connection)
+    else:
+        retention.archive_table(metadata.tables['admin_logs']).create(connection, checkfirst=True)
+
+
+@migration(12, 'photo variant indexes')
+def photo_variant_indexes(connection, metadata):
+    for name, table, columns in PHOTO_INDEXES:
+        connection.execute(text(f'CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})'))
+
+
+def partition_admin_logs(connection):
+    """Rebuild admin_logs as a table range-partitioned by month, plus a partitioned admin_logs_archive.
+
+    The primary key has to include the partition key, so it becomes
+    (id, created_at); ids still come from the same sequence.
+    """
+    if retention.is_partitioned(connection, 'admin_logs'):
+        return
+    connection.execute(text('ALTER TABLE admin_logs RENAME TO admin_logs_unpartitioned'))
+    connection.execute(text('ALTER INDEX admin_logs_pkey RENAME TO admin_logs_unpartitioned_pkey'))
+    connection.execute(text('DROP INDEX IF EXISTS ix_admin_logs_created'))
+    connection.execute(text('ALTER SEQUENCE admin_logs_id_seq OWNED BY NONE'))
+    connection.execute(text("""
+        CREATE TABLE admin_logs (
+            id INTEGER NOT NULL DEFAULT nextval('admin_logs_id_seq'),
+            admin_id INTEGER NOT NULL REFERENCES users(id),
+            action VARCHAR(100) NOT NULL,
+            target_type VARCHAR(50) NOT NULL,
+            target_id INTEGER,
+            details TEXT,
+            created_at TIMESTAMP NOT NULL,
+            PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at)
+    """))
+    connection.execute(text('ALTER SEQUENCE admin_logs_id_seq OWNED BY admin_logs.id'))
+    # Catches rows dated outside every monthly partition instead of failing the insert
+    connection.execute(text('CREATE TABLE admin_logs_default PARTITION OF admin_logs DEFAULT'))
+    now = datetime.utcnow()
+    oldest = connection.execute(text('SELECT MIN(created_at) FROM admin_logs_unpartitioned')).scalar()
+    retention.ensure_partitions(connection, 'admin_logs', oldest or now)
+    connection.execute(text("""
+        INSERT INTO admin_logs (id, admin_id, action, target_type, target_id, details, created_at)
+        SELECT id, admin_id, action, target_type, target_id, details, COALESCE(created_at, :now)
+        FROM admin_logs_unpartitioned
+    """), {'now': now})
+    connection.execute(text('DROP TABLE admin_logs_unpartitioned'))
+    connection.execute(text('CREATE INDEX ix_admin_logs_created ON admin_logs (created_at)'))
+    connection.execute(text('CREATE TABLE admin_logs_archive (LIKE admin_logs) PARTITION BY RANGE (created_at)'))
+
+
+def run_migrations(engine, metadata, log=print):
+    """Apply every migration that hasn't been applied yet, in order"""
+    with engine.begin() as connection:
+        connection.execute(text("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                description VARCHAR(200) NOT NULL,
+                applied_at TIMESTAMP NOT NULL
+            )
+        """))
+
+    applied = []
+    for version, description, fn in sorted(MIGRATIONS, key=lambda m: m[0]):
+        with engine.begin() as connection:
+            if connection.dialect.name == 'postgresql':
+                # Two instances starting at once must not run the same migration twice
+                connection.execute(text('SELECT pg_advisory_xact_lock(:id)'), {'id': MIGRATION_LOCK_ID})
+            done = connection.execute(
+                text('SELECT 1 FROM schema_migrations WHERE version = :version'), {'version': version}
+            ).first()
+            if done:
+                continue
+            log(f"🔄 Applying migration {version}: {description}")
+            fn(connection, metadata)
+            connection.execute(
+                text('INSERT INTO schema_migrations (version, description, applied_at) VALUES (:v, :d, :t)'),
+                {'v': version, 'd': description, 't': datetime.utcnow()}
+            )
+            applied.append(version)
+    return applied
@@ -0,0 +1,184 @@
+"""Content-addressed blob storage for report photos.
+
+Photos are stored once under the SHA-256 of their bytes, so the same image
+uploaded twice only takes up space once and a hash can be cached forever by
+browsers (its content can never change).
+
+Blobs are never deleted while a request may still be about to reference
+them: storing a blob that already exists refreshes its modification time,
+and unreferenced blobs are only collected once they are old enough (see
+collect_unreferenced_photos() in app.py).
+"""
+import base64
+import binascii
+import hashlib
+import os
+import re
+import tempfile
+
+CHUNK_SIZE = 64 * 1024
+
+SHA256_RE = re.compile(r'^[0-9a-f]{64}$')
+
+DATA_URL_RE = re.compile(r'^data:(?P<mime>[\w.+-]+/[\w.+-]+)?(?:;[^,]*)?;base64,(?P<data>.*)$', re.DOTALL)
+
+# Magic numbers for the image formats browsers actually send us
+_SIGNATURES = [
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+]
+
+
+class PhotoTooLarge(Exception):
+    """Raised when an upload streams past the configured size limit"""
+
+
+def sniff_content_type(head):
+    """Guess an image mimetype from the first bytes of a blob"""
+    for signature, mimetype in _SIGNATURES:
+        if head.startswith(signature):
+            return mimetype
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+    return 'application/octet-stream'
+
+
+def decode_data_url(value):
+    """Return the raw bytes of a base64 data URL, or None if it isn't one"""
+    if not value:
+        return None
+    match = DATA_URL_RE.match(value)
+    if not match:
+        return None
+    try:
+        return base64.b64decode(match.group('data'), validate=False)
+    except (binascii.Error, ValueError):
+        return None
+
+
+class LocalPhotoStore:
+    """Stores blobs on the local filesystem as <root>/ab/cd/<sha256>"""
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        os.makedirs(self.root, exist_ok=True)
+
+    def path_for(self, digest):
+        if not SHA256_RE.match(digest or ''):
+            raise ValueError(f'Invalid photo hash: {digest!r}')
+        return os.path.join(self.root, digest[:2], digest[2:4], digest)
+
+    def exists(self, digest):
+        try:
+            return os.path.exists(self.path_for(digest))
+        except ValueError:
+            return False
+
+    def put_bytes(self, data):
+        """Store a blob and return its SHA-256 hex digest"""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path_for(digest)
+        if self._refresh(path):
+            return digest
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temp file and rename so readers never see a partial blob
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        return digest
+
+    def put_stream(self, stream, max_bytes=None):
+        """Store a blob from a file-like object without holding it in memory.
+
+        The stream is copied in chunks to a temp file while it is hashed, then
+        renamed into place. Raises PhotoTooLarge once more than max_bytes
+        have been read.
+        """
+        hasher = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, prefix='.upload-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                while True:
+                    chunk = stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if max_bytes is not None and size > max_bytes:
+                        raise PhotoTooLarge(f'Photo exceeds {max_bytes} bytes')
+                    hasher.update(chunk)
+                    f.write(chunk)
+
+            digest = hasher.hexdigest()
+            path = self.path_for(digest)
+            if self._refresh(path):
+                os.unlink(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
+            return digest
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    def _refresh(self, path):
+        """Mark an existing blob as just written, so a collection pass leaves it alone; False if it is missing"""
+        try:
+            os.utime(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def written_before(self, cutoff):
+        """Hashes of the blobs last written before cutoff (a Unix timestamp)"""
+        for root, _, files in os.walk(self.root):
+            for name in files:
+                if SHA256_RE.match(name):
+                    try:
+                        if os.path.getmtime(os.path.join(root, name)) < cutoff:
+                            yield name
+                    except FileNotFoundError:
+                        continue
+
+    def read_bytes(self, digest):
+        with open(self.path_for(digest), 'rb') as f:
+            return f.read()
+
+    def content_type(self, digest):
+        with open(self.path_for(digest), 'rb') as f:
+            return sniff_content_type(f.read(16))
+
+    def delete(self, digest, written_before=None):
+        """Remove a blob, unless it was written at or after written_before; returns whether it was removed"""
+        try:
+            path = self.path_for(digest)
+            if written_before is not None and os.path.getmtime(path) >= written_before:
+                return False
+            os.unlink(path)
+            return True
+        except (FileNotFoundError, ValueError):
+            return False
+
+
+PHOTO_STORE_BACKENDS = {
+    'local': LocalPhotoStore,
+}
+
+
+def create_photo_store(backend, root):
+    """Build the configured photo store backend"""
+    try:
+        store_cls = PHOTO_STORE_BACKENDS[backend]
+    except KeyError:
+        raise ValueError(f'Unknown photo store backend: {backend!r}')
+    return store_cls(root)
@@ -0,0 +1,210 @@
+"""Query profiling for development and staging.
+
+QueryProfiler hooks into the engine's cursor events and, per request:
+
+- logs statements slower than slow_ms, with the route that ran them and the
+  shape of their parameters (types only, never the values)
+- flags N+1 patterns: the same statement shape run repeat_threshold or more
+  times in one request, as when a loop calls Model.query.get() per row
+- checks the request against the query budget its view declared with
+  @query_budget(n). In strict mode (tests) going over raises
+  QueryBudgetExceeded; otherwise it is logged like the other offenders.
+
+A statement's shape is its SQL with whitespace collapsed and IN lists
+folded, so `id IN (?, ?)` and `id IN (?, ?, ?)` count as the same query.
+explain() runs EXPLAIN on a recorded offender with the parameters it was
+first seen with. The profiler adds a few microseconds per statement, so it
+is meant to be switched on outside production (QUERY_PROFILER=1).
+"""
+import logging
+import re
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from sqlalchemy import event
+
+_WHITESPACE = re.compile(r'\s+')
+_PLACEHOLDER = r'(?:\?|%\(\w+\)s|%s|:\w+|\$\d+)'
+_IN_LIST = re.compile(rf'\(\s*{_PLACEHOLDER}(?:\s*,\s*{_PLACEHOLDER})+\s*\)')
+BACKGROUND = '(background)'
+
+log = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def query_budget(max_queries, max_repeats=None):
+    """Declare how many SQL statements a view may run per request.
+
+    max_repeats allows one statement shape to repeat that often by design
+    (e.g. a search widening step by step) without being flagged as N+1.
+    """
+    def declare(view):
+        view.query_budget = max_queries
+        view.query_repeats = max_repeats
+        return view
+    return declare
+
+
+def statement_shape(statement):
+    return _IN_LIST.sub('(?...)', _WHITESPACE.sub(' ', statement).strip())
+
+
+def parameter_shape(parameters, executemany=False):
+    """Parameter types without their values, e.g. {'email_1': 'str'}"""
+    if executemany:
+        rows = list(parameters or [])
+        return f"{len(rows)} rows of {parameter_shape(rows[0]) if rows else '{}'}"
+    if isinstance(parameters, dict):
+        return '{' + ', '.join(f"'{key}': {type(value).__name__}" for key, value in parameters.items()) + '}'
+    if isinstance(parameters, (list, tuple)):
+        return '(' + ', '.join(type(value).__name__ for value in parameters) + ')'
+    return type(parameters).__name__
+
+
+class _RequestQueries:
+    __slots__ = ('route', 'budget', 'repeat_threshold', 'count', 'seconds', 'shapes')
+
+    def __init__(self, route, budget, repeat_threshold):
+        self.route = route
+        self.budget = budget
+        self.repeat_threshold = repeat_threshold
+        self.count = 0
+        self.seconds = 0.0
+        self.shapes = {}  # shape -> [count, seconds, first statement, first parameters]
+
+
+class QueryProfiler:
+    def __init__(self, slow_ms=100, repeat_threshold=5, strict=False, history=200, log=log.warning):
+        self.slow_seconds = slow_ms / 1000
+        self.repeat_threshold = repeat_threshold
+        self.strict = strict
+        self.log = log
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.slow = deque(maxlen=history)
+        self.offenders = {}  # (kind, route, shape) -> details, see _flag()
+        self.routes = {}  # route -> [requests, statements, max statements, seconds]
+
+    def instrument(self, engine):
+        event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    def start_request(self, route, budget=None, max_repeats=None):
+        repeat_threshold = self.repeat_threshold if max_repeats is None else max(self.repeat_threshold, max_repeats + 1)
+        self._local.request = _RequestQueries(route or 'unmatched', budget, repeat_threshold)
+
+    def finish_request(self):
+        """Record the request's totals and offenders; raises QueryBudgetExceeded in strict mode"""
+        current = getattr(self._local, 'request', None)
+        self._local.request = None
+        if current is None:
+            return
+        with self._lock:
+            totals = self.routes.setdefault(current.route, [0, 0, 0, 0.0])
+            totals[0] += 1
+            totals[1] += current.count
+            totals[2] = max(totals[2], current.count)
+            totals[3] += current.seconds
+        for shape, (count, seconds, statement, parameters) in current.shapes.items():
+            if count >= current.repeat_threshold:
+                self._flag('n_plus_one', current.route, shape, statement, parameters,
+                           repeats=count, seconds=seconds)
+        if current.budget is not None and current.count > current.budget:
+            worst = max(current.shapes.items(), key=lambda item: item[1][0])
+            self._flag('over_budget', current.route, worst[0], worst[1][2], worst[1][3],
+                       repeats=current.count, seconds=current.seconds, budget=current.budget)
+            if self.strict:
+                raise QueryBudgetExceeded(
+                    f'{current.route} ran {current.count} queries, over its budget of {current.budget}; '
+                    f'most repeated: {worst[1][0]}x {worst[0]}'
+                )
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('profiler_started', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['profiler_started'].pop()
+        if getattr(self._local, 'paused', False):
+            return
+        current = getattr(self._local, 'request', None)
+        if current is not None:
+            current.count += 1
+            current.seconds += elapsed
+            shape = statement_shape(statement)
+            seen = current.shapes.get(shape)
+            if seen is None:
+                current.shapes[shape] = [1, elapsed, statement, parameters]
+            else:
+                seen[0] += 1
+                seen[1] += elapsed
+        if elapsed >= self.slow_seconds:
+            entry = {
+                'route': current.route if current else BACKGROUND,
+                'statement': statement_shape(statement),
+                'parameters': parameter_shape(parameters, executemany),
+                'ms': round(elapsed * 1000, 2),
+                'at': datetime.utcnow().isoformat(timespec='seconds'),
+            }
+            with self._lock:
+                self.slow.append(entry)
+            self.log('slow query', extra={'query_route': entry['route'], 'ms': entry['ms'],
+                                          'statement': entry['statement'][:200]})
+
+    def _flag(self, kind, route, shape, statement, parameters, **details):
+        key = (kind, route, shape)
+        with self._lock:
+            offender = self.offenders.get(key)
+            if offender is None:
+                offender = self.offenders[key] = {
+                    'kind': kind, 'route': route, 'statement': shape,
+                    'parameters': parameter_shape(parameters), 'occurrences': 0,
+                    '_sample': (statement, parameters),
+                }
+                self.log('N+1 query' if kind == 'n_plus_one' else 'query budget exceeded',
+                         extra={'query_route': route, 'queries': details['repeats'], 'statement': shape[:200]})
+            offender['occurrences'] += 1
+            offender['last_seen'] = datetime.utcnow().isoformat(timespec='seconds')
+            offender.update(details)
+
+    def explain(self, engine, offender):
+        """The query plan of an offender's first sample, or None if it isn't a SELECT"""
+        statement, parameters = offender['_sample']
+        if not statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+            return None
+        prefix = 'EXPLAIN QUERY PLAN ' if engine.dialect.name == 'sqlite' else 'EXPLAIN '
+        self._local.paused = True
+        try:
+            with engine.connect() as connection:
+                rows = connection.exec_driver_sql(prefix + statement, parameters).all()
+                connection.rollback()
+        finally:
+            self._local.paused = False
+        return [' '.join(str(value) for value in row) for row in rows]
+
+    def report(self, explain_engine=None):
+        """Slow statements, offenders and per-route totals; with explain_engine, offenders' query plans too"""
+        with self._lock:
+            routes = {route: {'requests': requests, 'queries_per_request': round(statements / requests, 2),
+                              'max_queries': most, 'query_ms_per_request': round(seconds / requests * 1000, 2)}
+                      for route, (requests, statements, most, seconds) in self.routes.items()}
+            offenders = [dict(offender) for offender in self.offenders.values()]
+            slow = list(self.slow)[::-1]
+        for offender in offenders:
+            if explain_engine is not None:
+                try:
+                    offender['plan'] = self.explain(explain_engine, offender)
+                except Exception as e:
+                    offender['plan'] = [f'EXPLAIN failed: {e}']
+            del offender['_sample']
+        return {'slow_queries': slow, 'offenders': offenders, 'routes': routes}
+
+    def reset(self):
+        with self._lock:
+            self.slow.clear()
+            self.offenders.clear()
+            self.routes.clear()
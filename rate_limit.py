@@ -0,0 +1,152 @@
+"""Token-bucket rate limiting with pluggable bucket stores.
+
+A TokenBucket allows `capacity` requests in a burst and refills at `rate`
+tokens per second. The state of each bucket (tokens left, last update) lives
+in a store:
+
+- MemoryBucketStore: a dict in this process. Fine for one worker or tests.
+- SharedMemoryBucketStore: a fixed-size table in a memory-mapped file, so
+  every gunicorn worker on the machine draws from the same buckets. It uses
+  open addressing over hashed keys with a short probe window.
+
+Stores implement update(key, fn), which atomically replaces a bucket's
+(tokens, updated_at) with fn(state) and returns the new state; fn receives
+None for an unknown key.
+"""
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+
+_SLOT = struct.Struct('<Qdd')  # key hash, tokens, updated_at
+_PROBE_LIMIT = 8
+
+
+class TokenBucket:
+    def __init__(self, store, name, capacity, rate):
+        self.store = store
+        self.name = name
+        self.capacity = float(capacity)
+        self.rate = float(rate)
+
+    def _refilled(self, state, now):
+        if state is None:
+            return self.capacity
+        tokens, updated_at = state
+        return min(self.capacity, tokens + (now - updated_at) * self.rate)
+
+    def take(self, key, cost=1.0):
+        """Take cost tokens for key. Returns (allowed, seconds until allowed again)."""
+        now = time.time()
+        result = {}
+
+        def spend(state):
+            tokens = self._refilled(state, now)
+            result['allowed'] = tokens >= cost
+            if result['allowed']:
+                tokens -= cost
+            result['retry_after'] = 0.0 if result['allowed'] else (cost - tokens) / self.rate
+            return tokens, now
+
+        self.store.update(f'{self.name}:{key}', spend)
+        return result['allowed'], result['retry_after']
+
+
+class MemoryBucketStore:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}
+
+    def update(self, key, fn):
+        with self._lock:
+            state = fn(self._buckets.get(key))
+            if state is None:
+                self._buckets.pop(key, None)
+            else:
+                self._buckets[key] = state
+            return state
+
+
+class SharedMemoryBucketStore:
+    """Buckets in an mmap'd file shared by every process that opens the same path.
+
+    slots bounds the memory used (24 bytes each). When a key's probe window
+    is full of live buckets, the one updated longest ago is overwritten,
+    which can only make the limiter more lenient, never lock anyone out.
+    """
+
+    def __init__(self, path=None, slots=16384):
+        self.path = path or default_shared_path()
+        self.slots = slots
+        self._lock = threading.Lock()
+        self._map = None
+        self._fd = None
+        self._fd_pid = None
+
+    def _open(self):
+        if self._map is None or self._fd_pid != os.getpid():
+            # Opened lazily, and again after a fork, so each process has its own handle
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            size = self.slots * _SLOT.size
+            if os.fstat(fd).st_size < size:
+                os.ftruncate(fd, size)
+            self._fd, self._fd_pid = fd, os.getpid()
+            self._map = mmap.mmap(fd, size, mmap.MAP_SHARED)
+        return self._map
+
+    @staticmethod
+    def _hash(key):
+        value = int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'little')
+        return value or 1  # 0 marks an empty slot
+
+    def update(self, key, fn):
+        key_hash = self._hash(key)
+        with self._lock:
+            table = self._open()
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                target, state = None, None
+                oldest, oldest_at = None, None
+                for i in range(_PROBE_LIMIT):
+                    slot = (key_hash + i) % self.slots
+                    stored_hash, tokens, updated_at = _SLOT.unpack_from(table, slot * _SLOT.size)
+                    if stored_hash == key_hash:
+                        target, state = slot, (tokens, updated_at)
+                        break
+                    if stored_hash == 0 and target is None:
+                        target = slot
+                    if oldest_at is None or updated_at < oldest_at:
+                        oldest, oldest_at = slot, updated_at
+                if target is None:
+                    target = oldest
+                new_state = fn(state)
+                if new_state is not None:
+                    _SLOT.pack_into(table, target * _SLOT.size, key_hash, *new_state)
+                elif state is not None:
+                    _SLOT.pack_into(table, target * _SLOT.size, 0, 0.0, 0.0)
+                return new_state
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+
+def default_shared_path():
+    """/dev/shm keeps the table in RAM where it exists; fall back to the temp dir"""
+    directory = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    return os.path.join(directory, f'communitycare-ratelimit-{os.getuid()}')
+
+
+BUCKET_STORES = {
+    'memory': lambda path: MemoryBucketStore(),
+    'shared': lambda path: SharedMemoryBucketStore(path),
+}
+
+
+def create_bucket_store(backend='shared', path=None):
+    try:
+        return BUCKET_STORES[backend](path)
+    except KeyError:
+        raise ValueError(f'Unknown rate limit backend: {backend}')
@@ -0,0 +1,240 @@
+"""Retention of old notifications, audit logs and sync tombstones.
+
+A RetentionPolicy picks the rows of one table that are old enough to go and
+says whether they are deleted or moved into <table>_archive (a copy of the
+table's columns without its constraints). enforce() works through them in
+batches of batch_size rows, oldest first, each batch in its own short
+transaction, so the job never holds row locks on more than one batch and
+live traffic keeps going in between.
+
+On PostgreSQL admin_logs is range-partitioned by month (migration 11). A
+partitioned table is archived a whole month at a time instead: once a
+month has ended before the cutoff, its partition is detached from the table
+and attached to <table>_archive, which moves no rows. Rows only leave at the
+end of their month, so they may stay up to a month past the policy's age.
+"""
+import logging
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import Column, MetaData, Table, and_, delete, insert, literal, select, text
+
+PARTITION_MONTHS_AHEAD = 3
+RETENTION_LOCK_ID = 7240116  # arbitrary key for pg_try_advisory_lock, next to MIGRATION_LOCK_ID
+PARTITION_LOCK_TIMEOUT = '2s'  # give up on a detach rather than queue every admin_logs query behind it
+
+_archive_metadata = MetaData()
+log = logging.getLogger(__name__)
+
+
+class RetentionPolicy:
+    """Rows of table whose age_column is more than days old and that match where.
+
+    archive moves them into <table>_archive before deleting them. tombstones
+    is the deleted_records table to note them in, so ?since= clients drop
+    them too (the table needs a user_id column). days=0 keeps rows forever.
+    """
+
+    def __init__(self, table, days, where=None, age_column='created_at', archive=False, tombstones=None):
+        self.table = table
+        self.days = days
+        self.where = where
+        self.age_column = table.c[age_column]
+        self.archive = archive
+        self.tombstones = tombstones
+
+    def condition(self, cutoff):
+        if self.where is None:
+            return self.age_column < cutoff
+        return and_(self.where, self.age_column < cutoff)
+
+
+def archive_table(table):
+    """<table>_archive with the same columns as table"""
+    name = f'{table.name}_archive'
+    if name not in _archive_metadata.tables:
+        Table(name, _archive_metadata,
+              *[Column(column.name, column.type, primary_key=column.primary_key, autoincrement=False)
+                for column in table.columns])
+    return _archive_metadata.tables[name]
+
+
+def enforce(engine, policy, now=None, batch_size=1000, pause=0.05):
+    """Apply one policy; returns the number of rows removed from the table"""
+    if not policy.days:
+        return 0
+    now = now or datetime.utcnow()
+    cutoff = now - timedelta(days=policy.days)
+    if policy.archive and engine.dialect.name == 'postgresql':
+        with engine.connect() as connection:
+            partitioned = is_partitioned(connection, policy.table.name)
+        if partitioned:
+            return archive_partitions(engine, policy.table.name, cutoff)
+
+    table = policy.table
+    removed = 0
+    while True:
+        with engine.begin() as connection:
+            # SKIP LOCKED: rows a request is updating right now wait for the next run
+            ids = connection.scalars(
+                select(table.c.id).where(policy.condition(cutoff))
+                .order_by(policy.age_column).limit(batch_size)
+                .with_for_update(skip_locked=True)
+            ).all()
+            if not ids:
+                break
+            batch = table.c.id.in_(ids)
+            if policy.archive:
+                connection.execute(insert(archive_table(table))
+                                   .from_select(table.columns.keys(), select(table).where(batch)))
+            if policy.tombstones is not None:
+                connection.execute(insert(policy.tombstones).from_select(
+                    ['table_name', 'record_id', 'user_id', 'deleted_at'],
+                    select(literal(table.name), table.c.id, table.c.user_id, literal(now)).where(batch)
+                ))
+            connection.execute(delete(table).where(batch))
+        removed += len(ids)
+        if len(ids) < batch_size:
+            break
+        time.sleep(pause)
+    return removed
+
+
+def enforce_all(engine, policies, now=None, batch_size=1000):
+    """Apply every policy, in one process at a time; returns {table: rows removed}
+
+    Returns None without doing anything while another process holds the
+    retention lock (PostgreSQL only).
+    """
+    with engine.connect() as lock_connection:
+        if engine.dialect.name == 'postgresql':
+            locked = lock_connection.scalar(text('SELECT pg_try_advisory_lock(:id)'), {'id': RETENTION_LOCK_ID})
+            lock_connection.commit()
+            if not locked:
+                return None
+        try:
+            removed = {}
+            for policy in policies:
+                if policy.archive and engine.dialect.name == 'postgresql':
+                    with engine.begin() as connection:
+                        if is_partitioned(connection, policy.table.name):
+                            ensure_partitions(connection, policy.table.name, now or datetime.utcnow())
+                removed[policy.table.name] = enforce(engine, policy, now=now, batch_size=batch_size)
+            return removed
+        finally:
+            if engine.dialect.name == 'postgresql':
+                lock_connection.execute(text('SELECT pg_advisory_unlock(:id)'), {'id': RETENTION_LOCK_ID})
+                lock_connection.commit()
+
+
+# Monthly partitions (PostgreSQL)
+
+def month_start(moment):
+    return datetime(moment.year, moment.month, 1)
+
+
+def next_month(start):
+    return datetime(start.year + start.month // 12, start.month % 12 + 1, 1)
+
+
+def partition_name(table_name, start):
+    return f'{table_name}_p{start:%Y%m}'
+
+
+def is_partitioned(connection, table_name):
+    return connection.execute(text("""
+        SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid
+        WHERE c.relname = :name AND pg_table_is_visible(c.oid)
+    """), {'name': table_name}).first() is not None
+
+
+def month_partitions(connection, table_name):
+    """(name, month start) of the monthly partitions attached to table_name, oldest first"""
+    names = connection.scalars(text("""
+        SELECT child.relname FROM pg_inherits i
+        JOIN pg_class child ON child.oid = i.inhrelid
+        JOIN pg_class parent ON parent.oid = i.inhparent
+        WHERE parent.relname = :name AND pg_table_is_visible(parent.oid)
+    """), {'name': table_name})
+    pattern = re.compile(rf'{re.escape(table_name)}_p(\d{{4}})(\d{{2}})$')
+    partitions = []
+    for name in names:
+        match = pattern.match(name)
+        if match:
+            partitions.append((name, datetime(int(match.group(1)), int(match.group(2)), 1)))
+    return sorted(partitions, key=lambda partition: partition[1])
+
+
+def ensure_partitions(connection, table_name, start, months_ahead=PARTITION_MONTHS_AHEAD):
+    """Create the monthly partitions of table_name from start's month to months_ahead after this one"""
+    month = month_start(start)
+    last = month_start(datetime.utcnow())
+    for _ in range(months_ahead):
+        last = next_month(last)
+    while month <= last:
+        name = partition_name(table_name, month)
+        try:
+            with connection.begin_nested():
+                connection.execute(text(
+                    f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table_name} "
+                    f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{next_month(month):%Y-%m-%d}')"
+                ))
+        except Exception as e:
+            # e.g. rows for that month already sit in the default partition
+            log.warning('could not create partition', extra={'partition': name, 'error': str(e)})
+        month = next_month(month)
+
+
+def archive_partitions(engine, table_name, cutoff):
+    """Move the partitions of months that ended before cutoff to <table>_archive; returns rows moved"""
+    moved = 0
+    with engine.connect() as connection:
+        partitions = month_partitions(connection, table_name)
+    for name, start in partitions:
+        end = next_month(start)
+        if end > cutoff:
+            break
+        with engine.begin() as connection:
+            connection.execute(text(f"SET LOCAL lock_timeout = '{PARTITION_LOCK_TIMEOUT}'"))
+            connection.execute(text(f'ALTER TABLE {table_name} DETACH PARTITION {name}'))
+            connection.execute(text(
+                f"ALTER TABLE {table_name}_archive ATTACH PARTITION {name} "
+                f"FOR VALUES FROM ('{start:%Y-%m-%d}') TO ('{end:%Y-%m-%d}')"
+            ))
+            moved += connection.scalar(text(f'SELECT COUNT(*) FROM {name}'))
+    return moved
+
+
+class PeriodicJob:
+    """Calls job() on a daemon thread, first after delay seconds and then every interval.
+
+    Started lazily, like OutboxWorker, so a pre-fork gunicorn master never
+    owns the thread.
+    """
+
+    def __init__(self, job, interval, delay=60.0, name='periodic-job'):
+        self.job = job
+        self.interval = interval
+        self.delay = delay
+        self.name = name
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        time.sleep(self.delay)
+        while True:
+            try:
+                self.job()
+            except Exception:
+                log.exception('periodic job failed', extra={'job': self.name})
+            time.sleep(self.interval)
@@ -0,0 +1,117 @@
+"""Full-text search over reports.
+
+On PostgreSQL each report carries a generated, weighted tsvector column with a
+GIN index. On SQLite (local development) an FTS5 table mirrors the same fields
+and is kept in sync by triggers. Either way a search is an index lookup rather
+than a scan of the reports table.
+
+Weights: problem_type > location > issue > resolution_notes.
+"""
+import re
+
+from sqlalchemy import text
+
+MAX_TERMS = 8
+
+POSTGRES_SCHEMA = [
+    """
+    ALTER TABLE reports ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', coalesce(problem_type, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(location, '')), 'B') ||
+        setweight(to_tsvector('simple', coalesce(issue, '')), 'C') ||
+        setweight(to_tsvector('simple', coalesce(resolution_notes, '')), 'D')
+    ) STORED
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_reports_search_vector ON reports USING GIN (search_vector)",
+]
+
+SQLITE_SCHEMA = [
+    """
+    CREATE VIRTUAL TABLE reports_fts USING fts5(
+        problem_type, location, issue, resolution_notes,
+        content='reports', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER reports_fts_insert AFTER INSERT ON reports BEGIN
+        INSERT INTO reports_fts(rowid, problem_type, location, issue, resolution_notes)
+        VALUES (new.id, new.problem_type, new.location, new.issue, new.resolution_notes);
+    END
+    """,
+    """
+    CREATE TRIGGER reports_fts_delete AFTER DELETE ON reports BEGIN
+        INSERT INTO reports_fts(reports_fts, rowid, problem_type, location, issue, resolution_notes)
+        VALUES ('delete', old.id, old.problem_type, old.location, old.issue, old.resolution_notes);
+    END
+    """,
+    """
+    CREATE TRIGGER reports_fts_update AFTER UPDATE OF problem_type, location, issue, resolution_notes ON reports BEGIN
+        INSERT INTO reports_fts(reports_fts, rowid, problem_type, location, issue, resolution_notes)
+        VALUES ('delete', old.id, old.problem_type, old.location, old.issue, old.resolution_notes);
+        INSERT INTO reports_fts(rowid, problem_type, location, issue, resolution_notes)
+        VALUES (new.id, new.problem_type, new.location, new.issue, new.resolution_notes);
+    END
+    """,
+    # Index whatever was in the reports table before the FTS table existed
+    "INSERT INTO reports_fts(reports_fts) VALUES ('rebuild')",
+]
+
+
+def ensure_search_schema(connection):
+    """Create the search column/index (PostgreSQL) or FTS5 table (SQLite)"""
+    dialect = connection.dialect.name
+    if dialect == 'postgresql':
+        for statement in POSTGRES_SCHEMA:
+            connection.execute(text(statement))
+    elif dialect == 'sqlite':
+        exists = connection.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'reports_fts'")
+        ).first()
+        if not exists:
+            for statement in SQLITE_SCHEMA:
+                connection.execute(text(statement))
+
+
+def search_terms(query):
+    """Split a user query into safe search terms (letters and digits only)"""
+    return re.findall(r'\w+', (query or '').lower())[:MAX_TERMS]
+
+
+def search_report_ids(connection, query, user_id=None, limit=20, offset=0):
+    """Return report ids matching every term of query, best match first.
+
+    Every term is matched as a prefix so partially typed words work for
+    type-ahead. Pass user_id to restrict the search to one user's reports.
+    """
+    terms = search_terms(query)
+    if not terms:
+        return []
+
+    params = {'limit': limit, 'offset': offset}
+    user_filter = ''
+    if user_id is not None:
+        user_filter = 'AND r.user_id = :user_id'
+        params['user_id'] = user_id
+
+    dialect = connection.dialect.name
+    if dialect == 'postgresql':
+        params['query'] = ' & '.join(f'{term}:*' for term in terms)
+        sql = f"""
+            SELECT r.id FROM reports r, to_tsquery('simple', :query) q
+            WHERE r.search_vector @@ q {user_filter}
+            ORDER BY ts_rank_cd(r.search_vector, q) DESC, r.id DESC
+            LIMIT :limit OFFSET :offset
+        """
+    elif dialect == 'sqlite':
+        params['query'] = ' '.join(f'"{term}"*' for term in terms)
+        sql = f"""
+            SELECT r.id FROM reports_fts JOIN reports r ON r.id = reports_fts.rowid
+            WHERE reports_fts MATCH :query {user_filter}
+            ORDER BY bm25(reports_fts, 10.0, 5.0, 2.0, 1.0), r.id DESC
+            LIMIT :limit OFFSET :offset
+        """
+    else:
+        raise NotImplementedError(f'Report search is not supported on {dialect}')
+
+    return [row[0] for row in connection.execute(text(sql), params)]
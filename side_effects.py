@@ -0,0 +1,59 @@
+"""Background flushing of post-commit side effects (audit logs, notifications).
+
+Request handlers write each side effect as a row in the outbox table inside
+their own transaction, so it is durable the moment the main change commits.
+OutboxWorker then drains the outbox on a background thread, turning many
+small writes into a few bulk inserts. Rows left behind by a crash are picked
+up on the next idle sweep.
+"""
+import logging
+import threading
+
+log = logging.getLogger(__name__)
+
+
+class OutboxWorker:
+    """Calls flush() once batch_size entries are pending or flush_interval
+    seconds after the first one, and every idle_interval seconds regardless.
+
+    flush() must drain the outbox itself; the worker only decides when. The
+    thread is started lazily so a pre-fork gunicorn master never owns it.
+    """
+
+    def __init__(self, flush, batch_size=100, flush_interval=0.5, idle_interval=30.0):
+        self.flush = flush
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.idle_interval = idle_interval
+        self._cond = threading.Condition()
+        self._pending = 0
+        self._thread = None
+
+    def ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._cond:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='outbox-worker', daemon=True)
+                self._thread.start()
+
+    def notify(self, count=1):
+        """Tell the worker that count more entries were committed to the outbox"""
+        self.ensure_started()
+        with self._cond:
+            self._pending += count
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._pending:
+                    self._cond.wait(timeout=self.idle_interval)
+                if self._pending and self._pending < self.batch_size:
+                    # Let a few more writes join this batch
+                    self._cond.wait_for(lambda: self._pending >= self.batch_size, timeout=self.flush_interval)
+                self._pending = 0
+            try:
+                self.flush()
+            except Exception:
+                log.exception('outbox flush failed')
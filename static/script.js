@@ -2,6 +2,7 @@
 let currentUser = null;
 let stream = null;
 let photoData = null;
+let photoBlob = null;
 let authCheckTimeout;
 
 // Initialize app
@@ -115,18 +116,19 @@ async function handleReportSubmit(e) {
         
         console.log('📤 Submitting report to server...');
         
+        // Send as multipart so the photo goes up as raw bytes instead of base64
+        const formData = new FormData();
+        formData.append('problem_type', problemType);
+        formData.append('location', location);
+        formData.append('issue', issue);
+        formData.append('priority', priority);
+        if (photoBlob) {
+            formData.append('photo', photoBlob, photoBlob.name || 'photo.jpg');
+        }
+        
         const response = await fetch('/api/submit_report', {
             method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-            },
-            body: JSON.stringify({
-                problem_type: problemType,
-                location: location,
-                issue: issue,
-                priority: priority,
-                photo_data: photoData
-            })
+            body: formData
         });
         
         const data = await response.json();
@@ -258,12 +260,84 @@ function showBrowserNotification(title, message, icon = null) {
     return notification;
 }
 
+// Server-Sent Events push channel. Polling below only runs while it is down.
+let eventSource = null;
+let eventStreamConnected = false;
+const EVENT_STREAM_RETRY_MS = 3 * 60 * 1000;
+
+function setupEventStream() {
+    if (!currentUser || !window.EventSource || eventSource) return;
+    
+    eventSource = new EventSource('/api/events');
+    eventSource.onopen = () => { eventStreamConnected = true; };
+    // The browser reconnects on its own; until then the pollers take over
+    eventSource.onerror = () => {
+        eventStreamConnected = false;
+        // Closed for good (the server had no room for another stream): poll, and try again in a few minutes
+        if (eventSource && eventSource.readyState === EventSource.CLOSED) {
+            eventSource = null;
+            setTimeout(setupEventStream, EVENT_STREAM_RETRY_MS + Math.random() * EVENT_STREAM_RETRY_MS);
+        }
+    };
+    
+    eventSource.addEventListener('report_created', (e) => {
+        const data = JSON.parse(e.data);
+        document.dispatchEvent(new CustomEvent('newReportSubmitted', {
+            detail: { problemType: data.problem_type, location: data.location }
+        }));
+        loadAdminNotificationsCount();
+    });
+    
+    eventSource.addEventListener('report_updated', (e) => {
+        const data = JSON.parse(e.data);
+        document.dispatchEvent(new CustomEvent('reportStatusUpdated', {
+            detail: { userId: data.user_id, problemType: data.problem_type, status: data.status }
+        }));
+    });
+    
+    eventSource.addEventListener('report_deleted', (e) => {
+        const data = JSON.parse(e.data);
+        removeDeletedReport(data.report_id);
+    });
+    
+    eventSource.addEventListener('notifications_changed', () => {
+        if (currentUser && currentUser.role !== 'admin') {
+            loadNotificationsCount();
+        }
+    });
+    
+    eventSource.addEventListener('notification', (e) => {
+        const data = JSON.parse(e.data);
+        showBrowserNotification(data.title || 'CommunityCare', data.message);
+    });
+}
+
+// Drop a report deleted elsewhere (another tab, or an admin) from the lists and the cached copy
+function removeDeletedReport(reportId) {
+    document.querySelectorAll(`.report-card[data-report-id="${reportId}"]`).forEach(card => card.remove());
+    
+    const storedReports = JSON.parse(localStorage.getItem('userReports') || '[]');
+    const remainingReports = storedReports.filter(r => r.id !== reportId);
+    if (remainingReports.length !== storedReports.length) {
+        localStorage.setItem('userReports', JSON.stringify(remainingReports));
+    }
+}
+
+function closeEventStream() {
+    if (eventSource) {
+        eventSource.close();
+        eventSource = null;
+    }
+    eventStreamConnected = false;
+}
+
 // Periodic check for updates
 function setupPeriodicUpdateCheck() {
     if (!currentUser) return;
     
-    // Check every 30 seconds for updates
+    // Check every 30 seconds for updates (skipped while the event stream is up)
     setInterval(async () => {
+        if (eventStreamConnected) return;
         try {
             await checkForUpdates();
         } catch (error) {
@@ -296,8 +370,10 @@ async function checkUserUpdates() {
         const notificationsResponse = await fetch('/api/notifications_count');
         const notificationsData = await notificationsResponse.json();
         
-        // Check for report status updates
-        const reportsResponse = await fetch('/api/user_reports');
+        // Check for report status updates - only the changes since the last check
+        const syncToken = localStorage.getItem('userReportsSyncToken');
+        const reportsUrl = syncToken ? `/api/user_reports?since=${encodeURIComponent(syncToken)}` : '/api/user_reports';
+        const reportsResponse = await fetch(reportsUrl);
         const reportsData = await reportsResponse.json();
         
         if (reportsData.success) {
@@ -318,8 +394,18 @@ async function checkUserUpdates() {
                 });
             }
             
-            // Store current reports for next comparison
-            localStorage.setItem('userReports', JSON.stringify(reportsData.reports));
+            // Merge the changes into the stored reports for next comparison
+            // (no deleted_ids means the token was too old and this is the full list)
+            let mergedReports = reportsData.reports;
+            if (syncToken && reportsData.deleted_ids) {
+                const changedIds = new Set(reportsData.reports.map(r => r.id));
+                const deletedIds = new Set(reportsData.deleted_ids || []);
+                mergedReports = storedReports
+                    .filter(r => !changedIds.has(r.id) && !deletedIds.has(r.id))
+                    .concat(reportsData.reports);
+            }
+            localStorage.setItem('userReports', JSON.stringify(mergedReports));
+            localStorage.setItem('userReportsSyncToken', reportsData.sync_token);
         }
         
         localStorage.setItem('lastUpdateCheck', Date.now());
@@ -362,6 +448,8 @@ async function checkAdminUpdates() {
 function setupRealTimeNotifications() {
     if (!currentUser) return;
     
+    setupEventStream();
+    
     // Listen for custom events (you can trigger these from your backend)
     document.addEventListener('newReportSubmitted', (event) => {
         if (currentUser.role === 'admin') {
@@ -733,12 +821,15 @@ async function logout() {
         
         if (data.success) {
             console.log('✅ Logout successful');
+            closeEventStream();
             currentUser = null;
             photoData = null;
+            photoBlob = null;
             stream = null;
             
             // Clear any stored data
             localStorage.removeItem('userReports');
+            localStorage.removeItem('userReportsSyncToken');
             localStorage.removeItem('lastUpdateCheck');
             localStorage.removeItem('lastAdminUpdateCheck');
             localStorage.removeItem('lastNewReportCount');
@@ -870,6 +961,7 @@ function capturePhoto() {
     context.drawImage(video, 0, 0, canvas.width, canvas.height);
     
     photoData = canvas.toDataURL('image/jpeg', 0.8);
+    canvas.toBlob(blob => { photoBlob = blob; }, 'image/jpeg', 0.8);
     
     // Show preview
     const preview = document.getElementById('photo-preview');
@@ -888,6 +980,8 @@ function handleFileUpload(file) {
         return;
     }
     
+    photoBlob = file;
+    
     const reader = new FileReader();
     reader.onload = function(e) {
         photoData = e.target.result;
@@ -906,6 +1000,7 @@ function handleFileUpload(file) {
 
 function removePhoto() {
     photoData = null;
+    photoBlob = null;
     document.getElementById('photo-preview').classList.add('hidden');
 }
 
@@ -939,19 +1034,53 @@ function showMyReports() {
     }
     
     showScreen('my-reports-screen');
+    showSkeletonLoader('reports-list', 3);
     loadMyReports();
 }
 
-async function loadMyReports() {
+// Report lists page through /api/reports: the first page when opened, the next one on "Load more"
+const REPORTS_PAGE_SIZE = 20;
+let myReportsCursor = null;
+let allReportsCursor = null;
+let allReportsShown = 0;
+
+function reportsPageUrl(cursor) {
+    return cursor
+        ? `/api/reports?limit=${REPORTS_PAGE_SIZE}&cursor=${encodeURIComponent(cursor)}`
+        : `/api/reports?limit=${REPORTS_PAGE_SIZE}`;
+}
+
+// Replace the list with the first page, or add the next page under it and move the button down
+function showReportsPage(reportsList, cardsHtml, append, cursor, loadMore) {
+    const oldButton = reportsList.querySelector('.load-more-reports');
+    if (oldButton) oldButton.remove();
+    if (append) {
+        reportsList.insertAdjacentHTML('beforeend', cardsHtml);
+    } else {
+        reportsList.innerHTML = cardsHtml;
+    }
+    if (cursor) {
+        reportsList.insertAdjacentHTML('beforeend', `
+            <div class="load-more-reports" style="text-align: center; margin: 16px 0;">
+                <button class="btn btn-outline" onclick="this.disabled = true; ${loadMore}">
+                    <i class="fas fa-chevron-down"></i> Load more
+                </button>
+            </div>
+        `);
+    }
+}
+
+async function loadMyReports(append = false) {
     try {
-        const response = await fetch('/api/user_reports');
+        const response = await fetch(reportsPageUrl(append ? myReportsCursor : null));
         const data = await response.json();
         
         const reportsList = document.getElementById('reports-list');
         
-        if (data.success && data.reports.length > 0) {
-            reportsList.innerHTML = data.reports.map(report => `
-                <div class="report-card">
+        if (data.success && (append || data.reports.length > 0)) {
+            myReportsCursor = data.next_cursor;
+            showReportsPage(reportsList, data.reports.map(report => `
+                <div class="report-card" data-report-id="${report.id}">
                     <div class="report-header">
                         <span class="report-type">${report.problem_type}</span>
                         <span class="report-status status-${report.status.toLowerCase().replace(' ', '-')}">
@@ -966,9 +1095,9 @@ async function loadMyReports() {
                         <span>${report.date}</span>
                         <span>${report.priority}</span>
                     </div>
-                    ${report.photo_data ? `
+                    ${report.photo_url ? `
                         <div class="report-photo">
-                            <img src="${report.photo_data}" alt="Report photo" style="max-width: 100%; border-radius: 8px; margin-top: 10px;">
+                            <a href="${report.photo_url}" target="_blank" rel="noopener"><img src="${report.photo_thumb_url || report.photo_url}" alt="Report photo" loading="lazy" style="max-width: 100%; border-radius: 8px; margin-top: 10px;"></a>
                         </div>
                     ` : ''}
                     ${report.status === 'Resolved' ? `
@@ -1015,7 +1144,7 @@ async function loadMyReports() {
                         </button>
                     </div>
                 </div>
-            `).join('');
+            `).join(''), append, myReportsCursor, 'loadMyReports(true)');
         } else {
             reportsList.innerHTML = `
                 <div style="text-align: center; padding: 40px 20px; color: #64748b;">
@@ -1096,6 +1225,16 @@ async function loadNotifications() {
             `;
         }
         
+        // The user has now seen everything listed
+        if (data.success && data.notifications.length > 0) {
+            const newestId = Math.max(...data.notifications.map(n => n.id));
+            await fetch('/api/notifications/mark_read', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ up_to_id: newestId })
+            });
+        }
+        
         // Update badge count
         await loadNotificationsCount();
     } catch (error) {
@@ -1309,22 +1448,24 @@ async function loadAdminStats() {
     }
 }
 
-async function loadAllReports() {
+async function loadAllReports(append = false) {
     try {
-        const response = await fetch('/api/all_reports');
+        const response = await fetch(reportsPageUrl(append ? allReportsCursor : null));
         const data = await response.json();
         
         const reportsList = document.getElementById('admin-reports-list');
         
-        if (data.success && data.reports.length > 0) {
+        if (data.success && (append || data.reports.length > 0)) {
+            allReportsCursor = data.next_cursor;
+            allReportsShown = (append ? allReportsShown : 0) + data.reports.length;
             // Set initial filter indicator
             const filterIndicator = document.getElementById('filter-indicator');
             if (filterIndicator) {
-                filterIndicator.textContent = `Showing: All Time (${data.reports.length} reports)`;
+                filterIndicator.textContent = `Showing: All Time (${allReportsShown}${allReportsCursor ? '+' : ''} reports)`;
             }
             
-            reportsList.innerHTML = data.reports.map(report => `
-                <div class="report-card">
+            showReportsPage(reportsList, data.reports.map(report => `
+                <div class="report-card" data-report-id="${report.id}">
                     <div class="report-header">
                         <span class="report-type">${report.problem_type}</span>
                         <span class="report-status status-${report.status.toLowerCase().replace(' ', '-')}">
@@ -1339,9 +1480,9 @@ async function loadAllReports() {
                         <span>By: ${report.username}</span>
                         <span>${report.date}</span>
                     </div>
-                    ${report.photo_data ? `
+                    ${report.photo_url ? `
                         <div class="report-photo">
-                            <img src="${report.photo_data}" alt="Report photo" style="max-width: 100%; border-radius: 8px; margin-top: 10px;">
+                            <a href="${report.photo_url}" target="_blank" rel="noopener"><img src="${report.photo_thumb_url || report.photo_url}" alt="Report photo" loading="lazy" style="max-width: 100%; border-radius: 8px; margin-top: 10px;"></a>
                         </div>
                     ` : ''}
                     <div class="admin-actions" style="margin-top: 10px; display: flex; gap: 8px; flex-wrap: wrap;">
@@ -1379,7 +1520,7 @@ async function loadAllReports() {
                         </div>
                     ` : ''}
                 </div>
-            `).join('');
+            `).join(''), append, allReportsCursor, 'loadAllReports(true)');
         } else {
             reportsList.innerHTML = `
                 <div style="text-align: center; padding: 20px; color: #64748b;">
@@ -1484,8 +1625,9 @@ function forceShowLogin() {
 // Setup periodic checking for new reports (admin only)
 function setupPeriodicReportCheck() {
     if (currentUser && currentUser.role === 'admin') {
-        // Check every 30 seconds
+        // Check every 30 seconds (skipped while the event stream is up)
         setInterval(async () => {
+            if (eventStreamConnected) return;
             try {
                 const response = await fetch('/api/new_reports_count');
                 const data = await response.json();
@@ -1804,7 +1946,7 @@ function displayFilteredReports(reports, period) {
             const isNewReport = (now - reportDate) <= (24 * 60 * 60 * 1000);
             
             return `
-                <div class="report-card ${isNewReport ? 'new-report-highlight' : ''}" style="margin-bottom: 16px;">
+                <div class="report-card ${isNewReport ? 'new-report-highlight' : ''}" data-report-id="${report.id}" style="margin-bottom: 16px;">
                     ${isNewReport ? `
                         <div class="new-badge">
                             <i class="fas fa-star"></i> NEW
@@ -1836,9 +1978,9 @@ function displayFilteredReports(reports, period) {
                         <span><i class="fas fa-calendar"></i> ${formatDate(report.date)}</span>
                     </div>
                     
-                    ${report.photo_data ? `
+                    ${report.photo_url ? `
                         <div class="report-photo" style="margin-top: 12px;">
-                            <img src="${report.photo_data}" alt="Report photo" style="width: 100%; max-height: 200px; object-fit: cover; border-radius: 8px; border: 1px solid #e2e8f0;">
+                            <a href="${report.photo_url}" target="_blank" rel="noopener"><img src="${report.photo_thumb_url || report.photo_url}" alt="Report photo" loading="lazy" style="width: 100%; max-height: 200px; object-fit: cover; border-radius: 8px; border: 1px solid #e2e8f0;"></a>
                         </div>
                     ` : ''}
                     
@@ -2407,26 +2549,6 @@ function showSkeletonLoader(containerId, count = 3) {
     }
 }
 
-// Progressive loading
-async function loadReportsWithPagination() {
-    showSkeletonLoader('reports-list', 3);
-    
-    try {
-        const response = await fetch('/api/reports?page=1&limit=10');
-        const data = await response.json();
-        
-        if (data.success) {
-            displayReports(data.reports);
-            
-            // Setup infinite scroll
-            setupInfiniteScroll();
-        }
-    } catch (error) {
-        console.error('Failed to load reports:', error);
-        showSnackbar('Failed to load reports', 'error');
-    }
-}
-
 // ========================
 // IMPROVED USER ONBOARDING
 // ========================
@@ -0,0 +1,23 @@
+import pytest
+
+from app import create_app, migrate_database
+
+
+@pytest.fixture(scope='session')
+def make_app(tmp_path_factory):
+    """make_app(**config): a TESTING app on its own migrated SQLite database"""
+    def make(**config):
+        directory = tmp_path_factory.mktemp('app')
+        app = create_app({
+            'TESTING': True,
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{directory / 'test.db'}",
+            'PHOTO_STORE_PATH': str(directory / 'photos'),
+            'RATE_LIMIT_BACKEND': 'memory',
+            'METRICS_DIR': str(directory / 'metrics'),
+            'PASSWORD_HASH_METHOD': 'pbkdf2:sha256:1000',
+            **config,
+        })
+        with app.app_context():
+            migrate_database()
+        return app
+    return make
@@ -0,0 +1,42 @@
+"""Sign-ups and logins can't keep a worker busy hashing passwords."""
+import app as app_module
+
+
+def register(client, name, **kwargs):
+    return client.post('/api/register', json={'username': name, 'email': f'{name}@example.com',
+                                               'password': 'pw', 'confirm_password': 'pw'}, **kwargs)
+
+
+def test_register_throttled_per_ip(make_app):
+    app = make_app(LOGIN_IP_BURST=3, LOGIN_IP_PER_MINUTE=1)
+    client = app.test_client()
+    for i in range(3):
+        assert register(client, f'user{i}').json['success']
+
+    response = register(client, 'user3')
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) >= 1
+    with app.app_context():
+        assert app_module.User.query.filter_by(username='user3').first() is None
+
+    # Another client IP has its own bucket
+    assert register(client, 'user4', environ_base={'REMOTE_ADDR': '10.0.0.9'}).json['success']
+
+
+def test_register_waits_for_a_hashing_slot(make_app, monkeypatch):
+    app = make_app(AUTH_HASH_CONCURRENCY=1)
+    monkeypatch.setattr(app_module, 'PASSWORD_HASH_WAIT_SECONDS', 0.05)
+    slots = app.extensions[app_module.EXTENSION]['password_hash_slots']
+    slots.acquire()  # another request is hashing
+    try:
+        response = register(app.test_client(), 'busy')
+    finally:
+        slots.release()
+    assert response.status_code == 503
+    assert register(app.test_client(), 'free').json['success']
+
+
+def test_debug_hashing_endpoints_removed(make_app):
+    client = make_app().test_client()
+    assert client.get('/api/debug/check_admin').status_code == 404
+    assert client.get('/api/debug/create_admin_force').status_code == 404
@@ -0,0 +1,22 @@
+"""create_app() never connects, so it is safe in a pre-fork gunicorn master."""
+from sqlalchemy import event
+
+import app as app_module
+import metrics
+from app import create_app, db
+
+
+def test_building_the_app_leaves_the_database_alone(tmp_path):
+    # Nothing listens on port 1: any connection attempt would fail
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'postgresql://nobody@127.0.0.1:1/none',
+                      'METRICS_DIR': str(tmp_path), 'QUERY_PROFILER': True})
+    backend = app.extensions[app_module.EXTENSION]['event_broker'].backend
+    assert isinstance(backend, app_module.PostgresNotifyBackend)
+
+    with app.app_context():
+        engine = db.engine
+    assert engine.pool.checkedin() == 0 and engine.pool.checkedout() == 0
+    # Instrumented as it was created
+    profiler = app.extensions[app_module.EXTENSION]['query_profiler']
+    assert event.contains(engine, 'before_cursor_execute', metrics._before_cursor_execute)
+    assert event.contains(engine, 'before_cursor_execute', profiler._before_cursor_execute)
@@ -0,0 +1,72 @@
+"""Linked duplicates follow their report, and outlive it when it is deleted."""
+import pytest
+
+import app as app_module
+from app import Notification, Report, ReportDedupBand, db, flush_outbox
+
+REPORT = {'problem_type': 'Pothole', 'location': 'Main Street 12',
+          'issue': 'Deep pothole in front of the school gate'}
+
+
+def login(client, email, password):
+    response = client.post('/api/login', json={'email': email, 'password': password})
+    assert response.json['success'], response.json
+    return client
+
+
+@pytest.fixture
+def app(make_app):
+    return make_app()
+
+
+@pytest.fixture
+def reports(app):
+    """Ids of a report and of the duplicate linked to it, from two reporters"""
+    ids = []
+    for name in ('pat', 'sam'):
+        user = app.test_client()
+        user.post('/api/register', json={'username': name, 'email': f'{name}@example.com',
+                                         'password': 'pw', 'confirm_password': 'pw'})
+        login(user, f'{name}@example.com', 'pw')
+        assert user.post('/api/submit_report', json=REPORT).json['success']
+        ids.append(user.get('/api/user_reports').json['reports'][0]['id'])
+    with app.app_context():
+        assert db.session.get(Report, ids[1]).duplicate_of == ids[0]
+    return ids
+
+
+def test_status_change_reaches_duplicate_subscribers(app, reports):
+    original, duplicate = reports
+    admin = login(app.test_client(), 'admin@community.com', 'admin123')
+    subscription = app.extensions[app_module.EXTENSION]['event_broker'].subscribe(['admins'])
+    try:
+        assert admin.post('/api/update_report_status',
+                          json={'report_id': original, 'status': 'In Progress'}).json['success']
+        updated = set()
+        while (message := subscription.get(timeout=0.1)) is not None:
+            event, data = message
+            if event == 'report_updated':
+                updated.add(data['report_id'])
+    finally:
+        subscription.close()
+    assert updated == {original, duplicate}
+
+
+def test_deleting_report_releases_duplicate(app, reports):
+    original, duplicate = reports
+    admin = login(app.test_client(), 'admin@community.com', 'admin123')
+    assert admin.post('/api/delete_report', json={'report_id': original}).json['success']
+    flush_outbox(app)
+
+    with app.app_context():
+        report = db.session.get(Report, duplicate)
+        assert report.duplicate_of is None and report.duplicate_status is None
+        assert ReportDedupBand.query.filter_by(report_id=duplicate).count()
+        notified = Notification.query.filter_by(report_id=duplicate, type='new_report').all()
+        assert [n.message for n in notified] and all(f'#{original} was deleted' in n.message for n in notified)
+
+    # The released report is matched again by later submissions
+    user = login(app.test_client(), 'pat@example.com', 'pw')
+    assert user.post('/api/submit_report', json=REPORT).json['success']
+    with app.app_context():
+        assert Report.query.order_by(Report.id.desc()).first().duplicate_of == duplicate
@@ -0,0 +1,114 @@
+"""Every @query_budget view stays within its budget.
+
+The app is built with TESTING, which puts the query profiler in strict mode:
+a request over its view's budget raises QueryBudgetExceeded instead of only
+being logged. Run with `python -m pytest` from the repository root.
+"""
+import pytest
+from sqlalchemy import text
+
+import app as app_module
+from app import db, flush_outbox
+from events import InProcessBackend
+from query_profiler import QueryBudgetExceeded, query_budget
+
+ADMIN = ('admin@community.com', 'admin123')
+USER = ('pat@example.com', 'pw')
+
+
+def login(client, email, password):
+    response = client.post('/api/login', json={'email': email, 'password': password})
+    assert response.json['success'], response.json
+    return client
+
+
+@pytest.fixture(scope='module')
+def app(make_app):
+    return make_app()
+
+
+@pytest.fixture(scope='module')
+def clients(app):
+    user = app.test_client()
+    user.post('/api/register', json={'username': 'pat', 'email': USER[0], 'password': USER[1],
+                                     'confirm_password': USER[1]})
+    login(user, *USER)
+    # Enough reports for a second page, some on the map
+    for i in range(25):
+        response = user.post('/api/submit_report', json={
+            'problem_type': 'Pothole' if i % 2 else 'Streetlight',
+            'location': f'Main Street {i}',
+            'issue': f'Deep pothole number {i} near the school',
+            'latitude': 14.5 + i / 1000,
+            'longitude': 121.0 + i / 1000,
+        })
+        assert response.json['success'], response.json
+
+    admin = login(app.test_client(), *ADMIN)
+    reports = admin.get('/api/all_reports').json['reports']
+    for report in reports[:3]:
+        admin.post('/api/update_report_status', json={'report_id': report['id'], 'status': 'In Progress'})
+    flush_outbox(app)  # the notifications and admin logs the updates queued
+    return {'user': user, 'admin': admin}
+
+
+def test_testing_app_is_strict(app):
+    profiler = app.extensions[app_module.EXTENSION]['query_profiler']
+    assert profiler is not None and profiler.strict
+
+
+def test_overrides_reach_derived_settings(app):
+    assert app.config['EVENT_BACKEND'] == 'memory'
+    assert isinstance(app.extensions[app_module.EXTENSION]['event_broker'].backend, InProcessBackend)
+
+
+@pytest.mark.parametrize('role, url', [
+    ('user', '/api/user_reports'),
+    ('user', '/api/reports'),
+    ('user', '/api/reports?status=In+Progress'),
+    ('user', '/api/search_reports?q=pothole'),
+    ('user', '/api/reports/within?bbox=120.9,14.4,121.1,14.6'),
+    ('user', '/api/reports/nearest?lat=14.51&lon=121.01&limit=5'),
+    ('user', '/api/reports/clusters?bbox=120.9,14.4,121.1,14.6&zoom=12'),
+    ('user', '/api/notifications'),
+    ('user', '/api/notifications_count'),
+    ('admin', '/api/reports'),
+    ('admin', '/api/search_reports?q=pothole'),
+    ('admin', '/api/reports/within?bbox=120.9,14.4,121.1,14.6'),
+    ('admin', '/api/reports/nearest?lat=14.51&lon=121.01&limit=50'),
+    ('admin', '/api/reports/clusters?bbox=120.9,14.4,121.1,14.6&zoom=3'),
+    ('admin', '/api/stats'),
+    ('admin', '/api/all_reports'),
+    ('admin', '/api/new_reports_count'),
+    ('admin', '/api/admin_audit_logs'),
+])
+def test_route_within_budget(clients, role, url):
+    response = clients[role].get(url)
+    assert response.status_code == 200
+    assert response.json.get('success') is not False, response.json  # the count endpoints only send the count
+
+
+def test_follow_up_pages_within_budget(clients):
+    user = clients['user']
+    first = user.get('/api/reports?limit=10').json
+    assert first['next_cursor']
+    second = user.get(f"/api/reports?limit=10&cursor={first['next_cursor']}").json
+    assert second['success'] and second['reports']
+
+    token = user.get('/api/user_reports').json['sync_token']
+    changes = user.get(f'/api/user_reports?since={token}')
+    assert changes.status_code == 200 and changes.json['success']
+
+
+def test_over_budget_raises(make_app):
+    app = make_app()
+
+    @app.route('/over-budget')
+    @query_budget(1)
+    def over_budget():
+        db.session.execute(text('SELECT 1'))
+        db.session.execute(text('SELECT 2'))
+        return 'ok'
+
+    with pytest.raises(QueryBudgetExceeded, match='over its budget of 1'):
+        app.test_client().get('/over-budget')
@@ -0,0 +1,53 @@
+"""report_counters follows status changes and is repaired by the retention job."""
+import pytest
+
+import app as app_module
+from app import ReportCounter, db, enforce_retention
+
+
+def login(client, email, password):
+    response = client.post('/api/login', json={'email': email, 'password': password})
+    assert response.json['success'], response.json
+    return client
+
+
+@pytest.fixture
+def app(make_app):
+    return make_app()
+
+
+@pytest.fixture
+def admin(app):
+    user = app.test_client()
+    user.post('/api/register', json={'username': 'pat', 'email': 'pat@example.com',
+                                     'password': 'pw', 'confirm_password': 'pw'})
+    login(user, 'pat@example.com', 'pw')
+    for i in range(3):
+        user.post('/api/submit_report', json={'problem_type': f'Type {i}', 'location': f'Street {i}',
+                                              'issue': f'Issue {i}'})
+    return login(app.test_client(), 'admin@community.com', 'admin123')
+
+
+def admin_stats(client):
+    return client.get('/api/stats').json['stats']
+
+
+def test_status_changes_move_counts(admin):
+    report_id = admin.get('/api/all_reports').json['reports'][0]['id']
+    for status in ('In Progress', 'In Progress', 'Resolved'):
+        assert admin.post('/api/update_report_status', json={'report_id': report_id, 'status': status}).json['success']
+    assert admin_stats(admin) == {'total': 3, 'pending': 2, 'in_progress': 0, 'resolved': 1}
+
+    admin.post('/api/delete_report', json={'report_id': report_id})
+    assert admin_stats(admin) == {'total': 2, 'pending': 2, 'in_progress': 0, 'resolved': 0}
+
+
+def test_retention_job_repairs_drift(app, admin):
+    with app.app_context():
+        counter = ReportCounter.query.filter_by(user_id=app_module.ALL_USERS, status='Pending').one()
+        counter.count = 7
+        db.session.commit()
+    assert admin_stats(admin)['pending'] == 7
+
+    enforce_retention(app)
+    assert admin_stats(admin) == {'total': 3, 'pending': 3, 'in_progress': 0, 'resolved': 0}
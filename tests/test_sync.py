@@ -0,0 +1,53 @@
+"""?since= delta sync of /api/user_reports, including deleted reports."""
+from datetime import datetime, timedelta
+
+import pytest
+
+
+def login(client, email, password):
+    response = client.post('/api/login', json={'email': email, 'password': password})
+    assert response.json['success'], response.json
+    return client
+
+
+def user_with_reports(app, name, count):
+    user = app.test_client()
+    user.post('/api/register', json={'username': name, 'email': f'{name}@example.com',
+                                     'password': 'pw', 'confirm_password': 'pw'})
+    login(user, f'{name}@example.com', 'pw')
+    for i in range(count):
+        assert user.post('/api/submit_report', json={'problem_type': f'Type {i}', 'location': f'{name} street {i}',
+                                                     'issue': f'Issue {i} reported by {name}'}).json['success']
+    return user
+
+
+@pytest.fixture
+def app(make_app):
+    return make_app()
+
+
+def test_since_returns_deleted_ids(app):
+    pat = user_with_reports(app, 'pat', 3)
+    sam = user_with_reports(app, 'sam', 1)
+    first = pat.get('/api/user_reports').json
+    mine = [r['id'] for r in first['reports']]
+    others = [r['id'] for r in sam.get('/api/user_reports').json['reports']]
+
+    assert pat.post('/api/delete_user_report', json={'report_id': mine[0]}).json['success']
+    assert sam.post('/api/delete_user_report', json={'report_id': others[0]}).json['success']
+
+    changes = pat.get(f"/api/user_reports?since={first['sync_token']}").json
+    assert changes['success']
+    assert changes['deleted_ids'] == [mine[0]]  # not the other user's deletion
+    assert mine[0] not in [r['id'] for r in changes['reports']]
+
+
+def test_since_older_than_tombstones_gets_full_list(app):
+    pat = user_with_reports(app, 'pat', 2)
+    report_id = pat.get('/api/user_reports').json['reports'][0]['id']
+    assert pat.post('/api/delete_user_report', json={'report_id': report_id}).json['success']
+
+    since = (datetime.utcnow() - timedelta(days=app.config['TOMBSTONE_RETENTION_DAYS'] + 1)).isoformat()
+    changes = pat.get(f'/api/user_reports?since={since}').json
+    assert changes['success'] and 'deleted_ids' not in changes
+    assert len(changes['reports']) == 1 and changes['reports'][0]['id'] != report_id